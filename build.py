@@ -0,0 +1,33 @@
+import argparse
+import logging
+
+from mylib.pipeline import Pipeline, STAGES
+
+LOGGER = logging.getLogger(__name__)
+
+
+def main(targets, force, workers, in_memory, materialize):
+    pipeline = Pipeline(STAGES)
+    if in_memory:
+        pipeline.run_in_memory(targets, force=force, materialize=materialize)
+    else:
+        pipeline.run(targets, force=force, workers=workers)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='run pipeline stages whose inputs have changed')
+    parser.add_argument('targets', nargs='*', help='stages to build together with their upstream (default: all)')
+    parser.add_argument('-f', '--force', action='store_true', help='run stages even if their inputs are unchanged')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='number of stages to run concurrently')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='run all stages in a single process and pass tables in memory')
+    parser.add_argument('--materialize', action='store_true', help='also write tables to disk in --in-memory mode')
+    args = parser.parse_args()
+    main(
+        targets=args.targets,
+        force=args.force,
+        workers=args.workers,
+        in_memory=args.in_memory,
+        materialize=args.materialize
+    )
@@ -6,6 +6,7 @@ from pathlib import Path
 import pandas as pd
 
 from mylib.artifact import Category, CategoryPage
+from mylib.table import read_table
 from mylib.utils import load_topic_map
 
 LOGGER = logging.getLogger(__name__)
@@ -15,7 +16,7 @@ IGNORE_TOPIC_ID_SET = {2, 3, 5}  # manually exclude some topic_ids to ensure div
 
 def main(category_fp, topic_fp, artifact_direc):
     category_df = pd.read_csv(category_fp)
-    topic_df = pd.read_csv(topic_fp)
+    topic_df = read_table(topic_fp)
     topic_df = topic_df[~(topic_df['topic_id'].isin(IGNORE_TOPIC_ID_SET))]
     topic_map = load_topic_map(topic_fp)
     LOGGER.info(f'loaded {len(category_df)} categories')
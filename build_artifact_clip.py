@@ -8,24 +8,26 @@ import pandas as pd
 from tqdm import tqdm
 
 from mylib.artifact import Speaker, Speech, Clip, ClipPage, Member, Topic
-from mylib.utils import to_time_str, load_minutes_record, load_topic_map
+from mylib.canonicalize import canonicalize_speech
+from mylib.corpus import open_corpus
+from mylib.table import read_table
+from mylib.utils import to_time_str, load_topic_map
 
 LOGGER = getLogger(__name__)
 
 
 def format_speech_text(text, thresh):
-    text = ''.join(text.split()[1:])
     if len(text) > thresh:
         text = text[:thresh] + '...'
     return text
 
 
-def build_speech(speech_record, thresh):
+def build_speech(speech, thresh):
     speaker = Speaker(
-        name=speech_record['speaker'],
-        info=speech_record['speakerPosition'] or speech_record['speakerGroup']
+        name=speech['speaker'],
+        info=speech['speaker_info']
     )
-    speech_text = format_speech_text(speech_record['speech'], thresh)
+    speech_text = format_speech_text(speech['text'], thresh)
     return Speech(
         speaker=speaker,
         speech=speech_text
@@ -33,43 +35,45 @@ def build_speech(speech_record, thresh):
 
 
 def build_speech_list(minutes_id, speech_id, speech_count=2, speech_thresh=300):
-    minutes_record = load_minutes_record(minutes_id)
+    corpus = open_corpus()
 
     speech_list = []
     for idx in range(speech_id, speech_id + speech_count):
-        if idx < len(minutes_record['speechRecord']):
-            speech_list.append(build_speech(minutes_record['speechRecord'][idx], speech_thresh))
+        if idx < corpus.speech_count(minutes_id):
+            speech = canonicalize_speech(corpus.get(minutes_id, idx))
+            speech_list.append(build_speech(speech, speech_thresh))
     return speech_list
 
 
 def main(clip_fp, member_fp, topic_fp,
          clip_minutes_fp, clip_member_fp, clip_gclip_fp, clip_clip_fp, clip_category_fp, clip_topic_fp,
          artifact_direc):
-    clip_df = pd.read_csv(clip_fp)
+    clip_df = read_table(clip_fp)
     LOGGER.info(f'loaded {len(clip_df)} clips')
 
-    member_df = pd.read_csv(member_fp)
-    clip_member_df = pd.read_csv(clip_member_fp)
-    clip_minutes_df = pd.read_csv(clip_minutes_fp)
-    clip_gclip_df = pd.read_csv(clip_gclip_fp)
-    clip_clip_df = pd.read_csv(clip_clip_fp)
-    clip_category_df = pd.read_csv(clip_category_fp)
-    clip_topic_df = pd.read_csv(clip_topic_fp)
+    member_df = read_table(member_fp)
+    clip_member_df = read_table(clip_member_fp)
+    clip_minutes_df = read_table(clip_minutes_fp)
+    clip_gclip_df = read_table(clip_gclip_fp)
+    clip_clip_df = read_table(clip_clip_fp)
+    clip_category_df = read_table(clip_category_fp)
+    clip_topic_df = read_table(clip_topic_fp)
 
     clip_df = pd.merge(clip_df, clip_member_df[['clip_id', 'member_id']], on='clip_id')
     clip_df = pd.merge(clip_df, clip_minutes_df[['clip_id', 'minutes_id', 'speech_id']], on='clip_id')
     clip_df = pd.merge(clip_df, clip_gclip_df[['clip_id', 'gclip_id', 'start_msec']], on='clip_id')
     clip_df = pd.merge(clip_df, clip_clip_df[['clip_id', 'clip_id_list']], on='clip_id')
     clip_df = pd.merge(clip_df, clip_category_df[['clip_id', 'category_id']], on='clip_id')
-    clip_df = pd.merge(clip_df, clip_topic_df[['clip_id', 'topic_id_list']], on='clip_id', how='left')\
-        .fillna({'topic_id_list': ''})
+    clip_df = pd.merge(clip_df, clip_topic_df[['clip_id', 'topic_id_list']], on='clip_id', how='left')
+    clip_df['topic_id_list'] = clip_df['topic_id_list'].map(lambda x: x if isinstance(x, list) else [])
     clip_df = pd.merge(clip_df, member_df[['member_id', 'group', 'block', 'image_url']], on='member_id')
     LOGGER.info(f'enriched {len(clip_df)} clips')
 
     topic_map = load_topic_map(topic_fp)
 
     clip_page_map = dict()
-    for _, row in tqdm(clip_df.iterrows()):
+    # read speeches of the same minutes together
+    for _, row in tqdm(clip_df.sort_values(by=['minutes_id', 'clip_id']).iterrows()):
         minutes_url = 'https://kokkai.ndl.go.jp/txt/{0}/{1}'.format(row['minutes_id'], row['speech_id'])
         video_url = 'https://gclip1.grips.ac.jp/video/video/{0}?t={1}'.format(
             row['gclip_id'], to_time_str(row['start_msec']))
@@ -93,7 +97,7 @@ def main(clip_fp, member_fp, topic_fp,
         )
 
         if row['topic_id_list']:
-            clip.topic_ids = list(map(int, row['topic_id_list'].split(';')))
+            clip.topic_ids = row['topic_id_list']
         speeches = build_speech_list(row['minutes_id'], row['speech_id'])
         clip_page = ClipPage(
             clip=clip,
@@ -109,8 +113,7 @@ def main(clip_fp, member_fp, topic_fp,
         clip_page = clip_page_map[clip_id]
 
         similar_clips = []
-        similar_id_list = map(int, row['clip_id_list'].split(';'))
-        for similar_id in similar_id_list:
+        for similar_id in row['clip_id_list']:
             if similar_id != clip_id and similar_id in clip_page_map:
                 similar_clips.append(clip_page_map[similar_id].clip)
 
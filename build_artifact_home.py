@@ -4,6 +4,7 @@ import logging
 import pandas as pd
 
 from mylib.artifact import HomePage
+from mylib.table import read_table
 
 LOGGER = logging.getLogger(__name__)
 
@@ -23,10 +24,10 @@ def load_category_page_artifact(category_artifact_direc, category_id):
 
 
 def main(clip_fp, category_fp, clip_category_fp, clip_artifact_direc, category_artifact_direc, artifact_fp):
-    clip_df = pd.read_csv(clip_fp)
+    clip_df = read_table(clip_fp)
     category_df = pd.read_csv(category_fp)
 
-    clip_category_df = pd.read_csv(clip_category_fp)
+    clip_category_df = read_table(clip_category_fp)
     clip_df = pd.merge(clip_df, clip_category_df, on='clip_id')
     clip_df = clip_df.sort_values(by=['date', 'clip_id'], ascending=[False, True])
 
@@ -6,19 +6,32 @@ from pathlib import Path
 import pandas as pd
 
 from mylib.artifact import Member, MemberPage
+from mylib.table import read_table
 from mylib.utils import load_topic_map
 
 LOGGER = logging.getLogger(__name__)
 
 
-def main(member_fp, topic_fp, member_topic_fp, artifact_direc):
-    member_df = pd.read_csv(member_fp)
-    member_topic_df = pd.read_csv(member_topic_fp)
-    member_df = pd.merge(member_df, member_topic_df[['member_id', 'topic_id_list']], on='member_id', how='left') \
-        .fillna({'topic_id_list': ''})
+def main(member_fp, topic_fp, member_topic_fp, member_member_fp, artifact_direc):
+    member_df = read_table(member_fp)
+    member_topic_df = read_table(member_topic_fp)
+    member_member_df = read_table(member_member_fp)
+    member_df = pd.merge(member_df, member_topic_df[['member_id', 'topic_id_list']], on='member_id', how='left')
+    member_df = pd.merge(member_df, member_member_df[['member_id', 'member_id_list']], on='member_id', how='left')
+    for column in ['topic_id_list', 'member_id_list']:
+        member_df[column] = member_df[column].map(lambda x: x if isinstance(x, list) else [])
     topic_map = load_topic_map(topic_fp)
     LOGGER.info(f'loaded {len(member_df)} members')
 
+    member_map = dict()
+    for _, row in member_df.iterrows():
+        member_map[row['member_id']] = Member(
+            member_id=row['member_id'],
+            name=row['name'],
+            group=row['group'],
+            block=row['block'],
+        )
+
     shutil.rmtree(artifact_direc, ignore_errors=True)
     Path(artifact_direc).mkdir(parents=True)
     for _, row in member_df.iterrows():
@@ -35,8 +48,10 @@ def main(member_fp, topic_fp, member_topic_fp, artifact_direc):
             member=member
         )
         if row['topic_id_list']:
-            topic_id_list = list(map(int, row['topic_id_list'].split(';')))
-            member_page.topics = [topic_map[topic_id] for topic_id in topic_id_list]
+            member_page.topics = [topic_map[topic_id] for topic_id in row['topic_id_list']]
+        members = [member_map[id_] for id_ in row['member_id_list'] if id_ in member_map]
+        if members:
+            member_page.members = members
 
         artifact_fp = Path(artifact_direc) / '{}.json'.format(member_id)
         with open(artifact_fp, 'w') as f:
@@ -51,5 +66,6 @@ if __name__ == '__main__':
         member_fp='./out/member.csv',
         topic_fp='./out/topic.csv',
         member_topic_fp='./out/member_topic.csv',
+        member_member_fp='./out/member_member.csv',
         artifact_direc='./out/artifact/member'
     )
@@ -6,14 +6,15 @@ from pathlib import Path
 import pandas as pd
 
 from mylib.artifact import TopicPage, Topic
+from mylib.table import read_table
 from mylib.utils import load_topic_map
 
 LOGGER = logging.getLogger(__name__)
 
 
 def main(topic_fp, topic_topic_fp, artifact_direc):
-    topic_df = pd.read_csv(topic_fp).fillna('')
-    topic_topic_df = pd.read_csv(topic_topic_fp)
+    topic_df = read_table(topic_fp).fillna('')
+    topic_topic_df = read_table(topic_topic_fp)
     topic_df = pd.merge(topic_df, topic_topic_df[['topic_id', 'topic_id_list']], on='topic_id')
     topic_map = load_topic_map(topic_fp)
     LOGGER.info(f'loaded {len(topic_df)} topics')
@@ -23,8 +24,7 @@ def main(topic_fp, topic_topic_fp, artifact_direc):
     for _, row in topic_df.iterrows():
         topic_id = row['topic_id']
         topic = Topic(topic_id=topic_id, title=row['title'], category_id=row['category_id'], description=row['desc'])
-        topic_id_list = list(map(int, row['topic_id_list'].split(';')))
-        topics = [topic_map[id_] for id_ in topic_id_list if id_ != topic_id]
+        topics = [topic_map[id_] for id_ in row['topic_id_list'] if id_ != topic_id]
         topic_page = TopicPage(
             topic=topic,
             topics=topics
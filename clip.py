@@ -7,6 +7,7 @@ import pandas as pd
 from politylink.utils import DateConverter, to_date_str
 
 from mylib.canonicalize import canonicalize_name, extract_issue, normalize_text
+from mylib.table import write_table
 
 LOGGER = getLogger(__name__)
 
@@ -92,7 +93,7 @@ def main(jsonl_fp, csv_fp):
 
     clip_df = pd.DataFrame(clips)
     clip_df.index = clip_df.index + 1
-    clip_df.to_csv(csv_fp, index_label='clip_id')
+    write_table(clip_df, csv_fp, index_label='clip_id')
     LOGGER.info(f'saved {len(clip_df)}　records to {csv_fp}')
 
 
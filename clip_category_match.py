@@ -2,11 +2,13 @@ import logging
 
 import pandas as pd
 
+from mylib.table import read_table, write_table
+
 LOGGER = logging.getLogger(__name__)
 
 
 def main(clip_fp, category_fp, match_fp):
-    clip_df = pd.read_csv(clip_fp)
+    clip_df = read_table(clip_fp)
     LOGGER.info(f'loaded {len(clip_df)} clips')
 
     cat_df = pd.read_csv(category_fp, dtype={'category_id': 'Int64'})
@@ -23,7 +25,7 @@ def main(clip_fp, category_fp, match_fp):
             is_missed.sum(), set(clip_df[is_missed]['title'])))
 
     out_df = clip_df[['clip_id', 'category_id']].dropna()
-    out_df.to_csv(match_fp, index=False)
+    write_table(out_df, match_fp)
     LOGGER.info(f'saved {len(out_df)} records to {match_fp}')
 
 
@@ -1,77 +1,233 @@
+import json
 import logging
+from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import spacy
 from tqdm import tqdm
 
-from build_artifact_clip import build_speech_list
-from mylib.canonicalize import normalize_text
-from mylib.utils import to_token_set, TokenFinder
-
-nlp = spacy.load('ja_ginza')
+from mylib.checkpoint import Journal, journal_path, to_fingerprint
+from mylib.nlp import tokenize
+from mylib.similarity import build_vocabulary, to_csr, top_k, iter_overlap_top_k, iter_candidate_top_k, \
+    iter_lsh_top_k, minhash_signatures, evaluate_recall
+from mylib.table import read_table, write_table
+from mylib.utils import TokenFinder, load_speech_record, load_speech_text, record_cache
 
 LOGGER = logging.getLogger(__name__)
 
+TOP_K = 5
+SPEECH_THRESH = 10000  # characters of each speech searched for tokens
+CHECKPOINT_SIZE = 2048  # number of new clips journaled at once
 
-def main(clip_fp, clip_minutes_fp, clip_clip_fp):
-    clip_df = pd.read_csv(clip_fp)
-    clip_minutes_df = pd.read_csv(clip_minutes_fp, dtype={'speech_id': 'Int64'})
-    clip_df = pd.merge(clip_df, clip_minutes_df[['clip_id', 'minutes_id', 'speech_id']], on='clip_id')
 
-    LOGGER.info(f'tokenizing {len(clip_df)} clips')
-    clip2tokens = dict()
-    for _, clip in tqdm(clip_df.iterrows()):
-        clip_id = clip['clip_id']
-        title = clip['title']
-
-        with nlp.select_pipes(enable=['parser']):
-            doc = nlp(title)
-        clip2tokens[clip_id] = to_token_set(doc)
-
-    all_tokens = set()
-    for s in clip2tokens.values():
-        all_tokens.update(s)
-
-    LOGGER.info(f'indexing {len(clip_df)} speeches')
-    token_finder = TokenFinder(all_tokens)
-    for _, clip in tqdm(clip_df.iterrows()):
-        speech_list = build_speech_list(clip['minutes_id'], clip['speech_id'], speech_count=2, speech_thresh=10000)
-        text = ''.join(map(lambda x: x.speech, speech_list))
-        text = normalize_text(text)
-        token_finder.index(clip['clip_id'], text)
+def to_clip_key(clip):
+    """
+    clips with the same key have the same title tokens and speech tokens
+    """
 
-    size = clip_df['clip_id'].max() + 1
-    dist_mat = np.zeros((size, size))
+    source_hash = load_speech_record(clip['minutes_id'])['source_hash']
+    return '{}\t{}\t{}\t{}'.format(clip['title'], clip['minutes_id'], clip['speech_id'], source_hash)
 
-    LOGGER.info(f'calculating similarity scores')
-    for src_id in tqdm(clip_df['clip_id']):
-        src_set = clip2tokens[src_id]
-        for trg_id in clip_df['clip_id']:
-            trg_set = token_finder.find(id_=trg_id)
-            score = (len(src_set & trg_set) / len(src_set))
-            dist_mat[src_id][trg_id] = score
 
-    records = []
-    for clip_id in tqdm(clip_df['clip_id']):
-        clip_id_list = np.argsort(dist_mat[clip_id])[-5:][::-1]
-        score_list = map(lambda x: dist_mat[clip_id][x], clip_id_list)
+def find_speech_tokens(clip_df, tokens):
+    """
+    key: clip_id, val: set of tokens found in the speeches of the clip
+    """
 
+    LOGGER.info(f'indexing {len(clip_df)} speeches with {len(tokens)} tokens')
+    token_finder = TokenFinder(tokens)
+    for _, clip in tqdm(clip_df.sort_values(by=['minutes_id', 'clip_id']).iterrows()):  # load each minutes once
+        text = load_speech_text(clip['minutes_id'], clip['speech_id'], speech_count=2, speech_thresh=SPEECH_THRESH)
+        token_finder.index(clip['clip_id'], text)
+    LOGGER.info(f'record cache: {record_cache.stats()}')
+    return {clip_id: set(token_finder.find(id_=clip_id)) for clip_id in clip_df['clip_id']}
+
+
+def load_state(state_fp, clip_df, mode):
+    """
+    state of the previous run, or None if it cannot be updated incrementally
+    """
+
+    if mode != 'exact':
+        LOGGER.warning(f'incremental update is not supported in {mode} mode')
+        return None
+    if not Path(state_fp).exists():
+        LOGGER.info(f'{state_fp} not found')
+        return None
+    with open(state_fp, 'r') as f:
+        state = json.load(f)
+    if state['mode'] != mode:
+        LOGGER.info(f'previous run was in {state["mode"]} mode')
+        return None
+    if state.get('speech_thresh') != SPEECH_THRESH:
+        LOGGER.info(f'previous run searched speeches with speech_thresh={state.get("speech_thresh")}')
+        return None
+
+    clip_map = {int(clip_id): clip for clip_id, clip in state['clips'].items()}
+    key_map = clip_df.set_index('clip_id')['key'].to_dict()
+    changed = [clip_id for clip_id, clip in clip_map.items() if key_map.get(clip_id) != clip['key']]
+    if changed:
+        LOGGER.info(f'found {len(changed)} removed or modified clips: {changed[:10]}')
+        return None
+    return clip_map
+
+
+def save_state(state_fp, clip_df, clip2tokens, clip2speech_tokens, clip2top_k, mode):
+    clip_map = dict()
+    for clip_id, key in zip(clip_df['clip_id'], clip_df['key']):
+        clip_id_list, score_list = clip2top_k[clip_id]
+        clip_map[str(clip_id)] = {
+            'key': key,
+            'title_tokens': sorted(clip2tokens[clip_id]),
+            'speech_tokens': sorted(clip2speech_tokens[clip_id]),
+            'clip_id_list': clip_id_list,
+            'score_list': score_list
+        }
+    with open(state_fp, 'w') as f:
+        json.dump({'mode': mode, 'speech_thresh': SPEECH_THRESH, 'clips': clip_map}, f, ensure_ascii=False)
+    LOGGER.info(f'saved state of {len(clip_map)} clips to {state_fp}')
+
+
+def iter_scores(top_k_iter, src_ids, trg_ids, total):
+    for i, columns, scores in tqdm(top_k_iter, total=total):
+        yield src_ids[i], trg_ids[columns].tolist(), scores.tolist()
+
+
+def main(clip_fp, clip_minutes_fp, clip_clip_fp, state_fp=None, n_process=1, mode='exact', max_postings=1000,
+         min_idf=0.0, bands=32, band_rows=4, max_bucket=1000, recall_sample=200, incremental=False, resume=False):
+    """
+    mode: 'exact' scores all pairs of clips, 'candidate' only scores pairs sharing a token (see iter_candidate_top_k),
+    'lsh' only scores pairs found by MinHash LSH over title and speech tokens (see iter_lsh_top_k)
+    incremental: only score pairs involving new clips, reusing tokens and top-k lists saved in state_fp
+    resume: skip chunks of new clips scored by the previous run that was interrupted, using the journal of scores
+    """
+
+    clip_df = read_table(clip_fp)
+    clip_minutes_df = read_table(clip_minutes_fp)
+    clip_df = pd.merge(clip_df, clip_minutes_df[['clip_id', 'minutes_id', 'speech_id']], on='clip_id')
+    clip_df = clip_df.sort_values(by='clip_id').reset_index(drop=True)  # keep column order equal to clip_id order
+    clip_df['key'] = clip_df.apply(to_clip_key, axis=1)
+
+    clip_map = load_state(state_fp, clip_df, mode) if incremental and state_fp else None
+    if clip_map is None:
+        old_df = clip_df.iloc[:0]
+        clip_map = dict()
+    else:
+        old_df = clip_df[clip_df['clip_id'].isin(clip_map)]
+    new_df = clip_df[~clip_df['clip_id'].isin(clip_map)]
+    LOGGER.info(f'found {len(new_df)} new clips and {len(old_df)} existing clips')
+
+    LOGGER.info(f'tokenizing {len(new_df)} clips')
+    clip2tokens = {clip_id: set(clip['title_tokens']) for clip_id, clip in clip_map.items()}
+    clip2tokens.update(tokenize(new_df['clip_id'], new_df['title'], n_process=n_process))
+
+    # speech tokens of existing clips only need to be updated with the tokens introduced by new clips
+    old_vocabulary = build_vocabulary(clip2tokens[clip_id] for clip_id in old_df['clip_id'])
+    vocabulary = build_vocabulary(clip2tokens.values())
+    added_tokens = [token for token in vocabulary if token not in old_vocabulary]
+    clip2speech_tokens = {clip_id: set(clip['speech_tokens']) for clip_id, clip in clip_map.items()}
+    if len(old_df) and added_tokens:
+        for clip_id, tokens in find_speech_tokens(old_df, added_tokens).items():
+            clip2speech_tokens[clip_id].update(tokens)
+    clip2speech_tokens.update(find_speech_tokens(new_df, vocabulary))
+
+    clip_ids = clip_df['clip_id'].to_numpy()
+    new_ids = new_df['clip_id'].to_numpy()
+    old_ids = old_df['clip_id'].to_numpy()
+    title_mat = to_csr([clip2tokens[clip_id] for clip_id in clip_ids], vocabulary)
+    speech_mat = to_csr([clip2speech_tokens[clip_id] for clip_id in clip_ids], vocabulary)
+    is_new = clip_df['clip_id'].isin(new_ids).to_numpy()
+    new_rows, old_rows = np.flatnonzero(is_new), np.flatnonzero(~is_new)
+
+    # scores of each chunk of new clips are journaled as soon as it completes,
+    # and are valid while the clips are unchanged
+    journal = Journal(journal_path(clip_clip_fp), to_fingerprint(
+        mode, TOP_K, max_postings, min_idf, bands, band_rows, max_bucket,
+        clip_df[['clip_id', 'key']].to_dict(orient='records'), new_ids.tolist()
+    ))
+    done = journal.load() if resume else dict()
+    journal.open()
+    pending = np.array([pos for pos in range(len(new_ids)) if pos // CHECKPOINT_SIZE not in done], dtype=int)
+    src_rows = new_rows[pending]
+
+    LOGGER.info(f'calculating similarity scores of {len(pending)} clips in {mode} mode')
+    if mode == 'exact':
+        top_k_iter = iter_overlap_top_k(title_mat[src_rows], speech_mat, k=TOP_K)
+    elif mode == 'candidate':
+        top_k_iter = iter_candidate_top_k(title_mat[src_rows], speech_mat, k=TOP_K, max_postings=max_postings,
+                                          min_idf=min_idf)
+    elif mode == 'lsh':
+        signatures = minhash_signatures(title_mat + speech_mat, num_perm=bands * band_rows)
+        top_k_iter = iter_lsh_top_k(title_mat[src_rows], speech_mat, signatures[src_rows], signatures, k=TOP_K,
+                                    bands=bands, max_bucket=max_bucket)
+    else:
+        raise ValueError(f'unknown mode: {mode}')
+
+    clip2top_k = dict()
+    chunk_unit, chunk_records = None, []
+    for pos, (clip_id, clip_id_list, score_list) in zip(pending, iter_scores(top_k_iter, new_ids[pending], clip_ids,
+                                                                              len(pending))):
+        if pos // CHECKPOINT_SIZE != chunk_unit:
+            if chunk_records:
+                journal.append(chunk_unit, chunk_records)
+            chunk_unit, chunk_records = int(pos // CHECKPOINT_SIZE), []
+        chunk_records.append((clip_id, clip_id_list, score_list))
+        clip2top_k[clip_id] = (clip_id_list, score_list)
+    if chunk_records:
+        journal.append(chunk_unit, chunk_records)
+    for chunk_records in done.values():
+        for clip_id, clip_id_list, score_list in chunk_records:
+            clip2top_k[clip_id] = (clip_id_list, score_list)
+
+    if mode == 'lsh':
+        approx_map = dict()
+        for i, clip_id in enumerate(new_ids):
+            clip_id_list, score_list = clip2top_k[clip_id]
+            approx_map[i] = (np.searchsorted(clip_ids, clip_id_list), score_list)
+        metrics = evaluate_recall(approx_map, title_mat[new_rows], speech_mat, k=TOP_K, sample_size=recall_sample)
+        LOGGER.info(f'recall against exact mode with bands={bands}, band_rows={band_rows}: {metrics}')
+    for clip_id, clip in clip_map.items():
+        clip2top_k[clip_id] = (clip['clip_id_list'], clip['score_list'])
+
+    if len(old_ids) and len(new_ids):
+        LOGGER.info(f'merging scores of {len(old_ids)} existing clips against new clips')
+        update_count = 0
+        top_k_iter = iter_overlap_top_k(title_mat[old_rows], speech_mat[new_rows], k=TOP_K)
+        for clip_id, clip_id_list, score_list in iter_scores(top_k_iter, old_ids, new_ids, len(old_ids)):
+            clip = clip_map[clip_id]
+            merged_ids = np.array(clip['clip_id_list'] + clip_id_list)
+            merged_scores = np.array(clip['score_list'] + score_list)
+            order = np.argsort(merged_ids)  # ties are broken by larger clip_id
+            columns = order[top_k(merged_scores[order], TOP_K)]
+            clip2top_k[clip_id] = (merged_ids[columns].tolist(), merged_scores[columns].tolist())
+            update_count += clip2top_k[clip_id][0] != clip['clip_id_list']
+        LOGGER.info(f'updated related clips of {update_count} existing clips')
+
+    records = []
+    for clip_id in clip_ids:
+        clip_id_list, score_list = clip2top_k[clip_id]
         records.append({
             'clip_id': clip_id,
-            'clip_id_list': ';'.join(map(str, clip_id_list)),
-            'score_list': ';'.join(map(lambda x: '{:.2f}'.format(x), score_list))
+            'clip_id_list': clip_id_list,
+            'score_list': score_list
         })
 
     out_df = pd.DataFrame(records)
-    out_df.to_csv(clip_clip_fp, index=False)
+    write_table(out_df, clip_clip_fp)
     LOGGER.info(f'saved {len(out_df)} records to {clip_clip_fp}')
 
+    if state_fp:
+        save_state(state_fp, clip_df, clip2tokens, clip2speech_tokens, clip2top_k, mode)
+    journal.remove()
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     main(
         clip_fp='./out/clip.csv',
         clip_minutes_fp='./out/clip_minutes.csv',
-        clip_clip_fp='./out/clip_clip.csv'
+        clip_clip_fp='./out/clip_clip.csv',
+        state_fp='./out/clip_clip_state.json',
+        incremental=True,
+        resume=True
     )
@@ -1,35 +1,147 @@
 import logging
+from bisect import bisect_left, bisect_right
 
 import pandas as pd
-import spacy
 
-from mylib.utils import load_minutes_record, load_gclip_record
-
-nlp = spacy.load('ja_ginza')
+from mylib.parallel import run_groups
+from mylib.table import read_table, write_table
+from mylib.utils import load_speech_record, load_transcript
 
 LOGGER = logging.getLogger(__name__)
 
+QSIZE = 10  # length of the parts of minutes speeches searched in transcripts
 
-def find_best_gclip_speech(minutes_speech, gclip_record, qsize=10):
-    text = ''.join(minutes_speech['speech'].split()[1:])  # remove name
-    for i in range(0, len(text) - qsize, qsize):
-        query = text[i: i + qsize]
 
-        match = []
-        for gclip_speech in gclip_record['speech_list']:
-            if query in gclip_speech['speech']:
-                match.append(gclip_speech)
+def find_best_gclip_speech(minutes_speech, ngram_index, qsize=QSIZE):
+    """
+    index of the speech in transcript that uniquely contains a part of minutes_speech.
+    ngram_index is Transcript.ngram_index(qsize)
+    """
+
+    j = find_gclip_speech_in_range(minutes_speech, ngram_index, 0, float('inf'), qsize)
+    if j is None:
+        raise ValueError(f'failed to find gclip match: {minutes_speech}')
+    return j
+
 
-        if len(match) == 1:  # found unique match
-            return match[0]
+def find_gclip_speech_in_range(minutes_speech, ngram_index, lo, hi, qsize=QSIZE):
+    """
+    same as find_best_gclip_speech, but only speeches from lo to hi (inclusive) in transcript are searched.
+    None if not found
+    """
+
+    text = minutes_speech['text']
+    for i in range(0, len(text) - qsize, qsize):
+        postings = ngram_index.get(text[i: i + qsize])
+        if not postings:
+            continue
+        start, end = bisect_left(postings, lo), bisect_right(postings, hi)
+        if end - start == 1:  # found unique match in range
+            return postings[start]
+    return None
+
+
+def find_monotonic_anchors(anchors):
+    """
+    longest subsequence of (speech_id, transcript index) whose transcript indices are non-decreasing
+    """
+
+    tails = []  # key: length - 1, val: position in anchors of the smallest tail
+    tail_values = []  # transcript index of each tail
+    prev = [-1] * len(anchors)
+    for k, (_, j) in enumerate(anchors):
+        pos = bisect_right(tail_values, j)
+        if pos > 0:
+            prev[k] = tails[pos - 1]
+        if pos == len(tails):
+            tails.append(k)
+            tail_values.append(j)
+        else:
+            tails[pos] = k
+            tail_values[pos] = j
+
+    result = []
+    k = tails[-1] if tails else -1
+    while k >= 0:
+        result.append(anchors[k])
+        k = prev[k]
+    return result[::-1]
+
+
+def align_speeches(minutes_speeches, transcript, ngram_index, qsize=QSIZE):
+    """
+    key: speech_id, val: index of the speech in transcript.
+    speeches with a unique match are used as anchors if they keep the order of both sides,
+    then the remaining speeches are searched in one pass in speech_id order, only between the surrounding anchors
+    """
+
+    minutes_speeches = sorted(minutes_speeches, key=lambda x: x['speech_id'])
+    anchors = []
+    for speech in minutes_speeches:
+        j = find_gclip_speech_in_range(speech, ngram_index, 0, float('inf'), qsize)
+        if j is not None:
+            anchors.append((speech['speech_id'], j))
+    anchors = find_monotonic_anchors(anchors)
+    alignment = dict(anchors)
+
+    bounds = anchors + [(float('inf'), len(transcript) - 1)]
+    k, lo = 0, 0
+    for speech in minutes_speeches:
+        speech_id = speech['speech_id']
+        while bounds[k][0] < speech_id:  # passed the anchor
+            lo = bounds[k][1]
+            k += 1
+        if bounds[k][0] == speech_id:
+            continue
+        j = find_gclip_speech_in_range(speech, ngram_index, lo, bounds[k][1], qsize)
+        if j is not None:
+            alignment[speech_id] = j
+            lo = j
+    return alignment
+
+
+def match_group(minutes_id, gclip_id, clips, mode):
+    """
+    match clips of the same minutes. returns records and errors
+    """
+
+    speech_record = load_speech_record(minutes_id)
+    transcript = load_transcript(gclip_id)
+    ngram_index = transcript.ngram_index(QSIZE)  # dropped with the group, as the transcript is only used once
+    alignment = dict()
+    if mode == 'align':
+        alignment = align_speeches(speech_record['speeches'], transcript, ngram_index)
+        LOGGER.info(f'aligned {len(alignment)} of {len(speech_record["speeches"])} speeches of {minutes_id}')
+
+    records, errors = [], []
+    for clip in clips:
+        try:
+            if clip['speech_id'] in alignment:
+                i = alignment[clip['speech_id']]
+            else:
+                minutes_speech = speech_record['speeches'][clip['speech_id']]
+                i = find_best_gclip_speech(minutes_speech, ngram_index)
+            records.append({
+                'clip_id': clip['clip_id'],
+                'gclip_id': gclip_id,
+                'start_msec': int(transcript.start_msec[i])
+            })
+        except Exception as e:
+            LOGGER.warning(f'failed to find gclip match for clip_id={clip["clip_id"]}: {e!r}')
+            errors.append({'clip_id': clip['clip_id'], 'minutes_id': minutes_id, 'error': repr(e)})
+    return records, errors
 
-    raise ValueError(f'failed to find gclip match: {minutes_speech}')
 
+def main(clip_fp, clip_minutes_fp, gclip_fp, clip_gclip_fp, error_fp, mode='clip', workers=1):
+    """
+    mode: 'clip' searches the speech of each clip independently,
+    'align' aligns all speeches of the minutes with the transcript in order (see align_speeches)
+    workers: number of processes matching minutes in parallel
+    """
 
-def main(clip_fp, clip_minutes_fp, gclip_fp, clip_gclip_fp):
-    clip_df = pd.read_csv(clip_fp)
-    clip_minutes_df = pd.read_csv(clip_minutes_fp, dtype={'speech_id': 'Int64'})
-    gclip_df = pd.read_csv(gclip_fp, dtype={'gclip_id': 'Int64'})
+    clip_df = read_table(clip_fp)
+    clip_minutes_df = read_table(clip_minutes_fp)
+    gclip_df = read_table(gclip_fp, dtype={'gclip_id': 'Int64'})
 
     clip_df = pd.merge(clip_df, clip_minutes_df[['clip_id', 'minutes_id', 'speech_id']], on='clip_id', how='left')
     clip_df = pd.merge(clip_df, gclip_df[['minutes_id', 'gclip_id']], on='minutes_id', how='left')
@@ -38,27 +150,22 @@ def main(clip_fp, clip_minutes_fp, gclip_fp, clip_gclip_fp):
     if is_missed.sum():
         LOGGER.warning('failed to assign gclip_id: ' + str(set(clip_df[is_missed]['minutes_id'])))
 
-    records = []
+    groups = []
     for minutes_id, df in clip_df.groupby('minutes_id'):
         gclip_id = df['gclip_id'].iloc[0]
         LOGGER.info(f'found {len(df)} clips for {gclip_id}')
+        clips = df[['clip_id', 'speech_id']].to_dict(orient='records')
+        groups.append((minutes_id, df['clip_id'].tolist(), (gclip_id, clips, mode)))
+    records, errors = run_groups(match_group, groups, workers=workers)
 
-        minutes_record = load_minutes_record(minutes_id)
-        gclip_record = load_gclip_record(gclip_id)
-
-        for _, clip in df.iterrows():
-            minutes_speech = minutes_record['speechRecord'][clip['speech_id']]
-            gclip_speech = find_best_gclip_speech(minutes_speech, gclip_record)
-
-            records.append({
-                'clip_id': clip['clip_id'],
-                'gclip_id': gclip_id,
-                'start_msec': gclip_speech['start_msec']
-            })
+    error_df = pd.DataFrame(errors, columns=['clip_id', 'minutes_id', 'error'])
+    write_table(error_df, error_fp)
+    if len(error_df):
+        LOGGER.warning(f'failed to match {len(error_df)} clips: {error_df["clip_id"].tolist()}')
 
     out_df = pd.DataFrame(records)
     out_df = out_df.sort_values(by='clip_id')
-    out_df.to_csv(clip_gclip_fp, index=False)
+    write_table(out_df, clip_gclip_fp)
     LOGGER.info(f'saved {len(out_df)} records to {clip_gclip_fp}')
 
 
@@ -68,5 +175,6 @@ if __name__ == '__main__':
         clip_fp='./out/clip.csv',
         clip_minutes_fp='./out/clip_minutes.csv',
         gclip_fp='./out/gclip.csv',
-        clip_gclip_fp='./out/clip_gclip.csv'
+        clip_gclip_fp='./out/clip_gclip.csv',
+        error_fp='./out/clip_gclip_error.csv'
     )
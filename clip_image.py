@@ -5,6 +5,8 @@ from pathlib import Path
 
 import pandas as pd
 
+from mylib.table import read_table
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -34,8 +36,8 @@ def process(clip):
 
 
 def main(gclip_fp, clip_gclip_fp):
-    gclip_df = pd.read_csv(gclip_fp)
-    clip_gclip_df = pd.read_csv(clip_gclip_fp)
+    gclip_df = read_table(gclip_fp)
+    clip_gclip_df = read_table(clip_gclip_fp)
     clip_gclip_df = pd.merge(clip_gclip_df, gclip_df, on='gclip_id')
     clips = clip_gclip_df.to_dict(orient='records')
     LOGGER.info(f'found {len(clips)} clips to process')
@@ -2,14 +2,16 @@ import logging
 
 import pandas as pd
 
+from mylib.table import read_table, write_table
+
 LOGGER = logging.getLogger(__name__)
 
 
 def main(clip_fp, member_fp, match_fp):
-    clip_df = pd.read_csv(clip_fp)
+    clip_df = read_table(clip_fp)
     LOGGER.info(f'loaded {len(clip_df)} clips')
 
-    member_df = pd.read_csv(member_fp, dtype={'member_id': 'Int64'})
+    member_df = read_table(member_fp, dtype={'member_id': 'Int64'})
     member_df['key'] = member_df['name'].map(lambda x: ''.join(x.split()))
     clip_df = pd.merge(
         clip_df[['clip_id', 'name']].rename(columns={'name': 'key'}),
@@ -23,7 +25,7 @@ def main(clip_fp, member_fp, match_fp):
             is_missed.sum(), set(clip_df[is_missed]['key'])))
 
     out_df = clip_df[['clip_id', 'member_id']].dropna()
-    out_df.to_csv(match_fp, index=False)
+    write_table(out_df, match_fp)
     LOGGER.info(f'saved {len(out_df)} records to {match_fp}')
 
 
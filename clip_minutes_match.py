@@ -1,48 +1,99 @@
 import logging
+import os
+from collections import defaultdict
 
 import pandas as pd
-import spacy
 
-from mylib.canonicalize import normalize_text
-from mylib.utils import load_minutes_record, TokenFinder, to_token_set
-
-nlp = spacy.load('ja_ginza')
+from mylib.checkpoint import Journal, journal_path, to_fingerprint
+from mylib.nlp import tokenize
+from mylib.parallel import run_groups
+from mylib.table import read_table, write_table
+from mylib.utils import get_speech_fp, load_speech_record, TokenFinder
 
 LOGGER = logging.getLogger(__name__)
 
 
-def find_best_speech(speaker_name, clip_title, minutes_record):
+class SpeechMatcher:
     """
-    find speech that best matches with clip title
+    match clips of the same minutes against its speeches.
+    each speech is normalized and scanned at most once with a single automaton over all clip tokens
     """
 
-    with nlp.select_pipes(enable=['parser']):
-        doc = nlp(clip_title)
-    clip_tokens = to_token_set(doc)
-    token_finder = TokenFinder(clip_tokens)
-
-    result = []
-    for speech_record in minutes_record['speechRecord']:
-        speaker = speech_record['speaker']
-        if speaker == speaker_name:
-            text = normalize_text(speech_record['speech'])
-            speech_id = speech_record['speechOrder']
-            token_finder.index(speech_id, text)
-            common_tokens = token_finder.find(id_=speech_id)
+    def __init__(self, speech_record, clip_tokens_list):
+        self.minutes_id = speech_record['minutes_id']
+        self.speaker_index = defaultdict(list)  # key: speaker name, val: list of speeches
+        for speech in speech_record['speeches']:
+            self.speaker_index[speech['speaker']].append(speech)
+
+        all_tokens = set()
+        for clip_tokens in clip_tokens_list:
+            all_tokens.update(clip_tokens)
+        self.token_finder = TokenFinder(all_tokens)
+        self.indexed_speakers = set()
+
+    def index(self, speaker_name):
+        if speaker_name in self.indexed_speakers:
+            return
+        for speech in self.speaker_index[speaker_name]:
+            self.token_finder.index(speech['speech_id'], speech['normalized_text'])
+        self.indexed_speakers.add(speaker_name)
+
+    def find_best_speech(self, speaker_name, clip_tokens):
+        """
+        find speech that best matches with tokens of clip title
+        """
+
+        if not self.speaker_index[speaker_name]:
+            raise ValueError('minutes_id={} does not have speech from {}'.format(self.minutes_id, speaker_name))
+        self.index(speaker_name)
+
+        result = []
+        for speech in self.speaker_index[speaker_name]:
+            speech_id = speech['speech_id']
+            common_tokens = self.token_finder.find(id_=speech_id) & clip_tokens
             score = len(common_tokens) / len(clip_tokens)
             result.append((speech_id, score))
+        return max(result, key=lambda x: x[1])
 
-    if not result:
-        raise ValueError('minutes_id={} does not have speech from {}'.format(minutes_record['issueID'], speaker_name))
 
-    return max(result, key=lambda x: x[1])
+def match_group(minutes_id, clips, clip_tokens_list):
+    """
+    match clips of the same minutes. returns records and errors
+    """
 
+    speech_record = load_speech_record(minutes_id)
+    matcher = SpeechMatcher(speech_record, clip_tokens_list)
+    records, errors = [], []
+    for clip, clip_tokens in zip(clips, clip_tokens_list):
+        try:
+            speech_id, score = matcher.find_best_speech(clip['name'], clip_tokens)
+            records.append({
+                'clip_id': clip['clip_id'],
+                'minutes_id': minutes_id,
+                'speech_id': speech_id,
+                'score': score
+            })
+        except Exception as e:
+            LOGGER.warning(f'failed to find match for clip_id={clip["clip_id"]}: {e!r}')
+            errors.append({'clip_id': clip['clip_id'], 'minutes_id': minutes_id, 'error': repr(e)})
+    return records, errors
+
+
+def to_speech_version(minutes_id):
+    speech_fp = get_speech_fp(minutes_id)
+    return os.stat(speech_fp).st_mtime_ns if os.path.exists(speech_fp) else None
+
+
+def main(clip_fp, minutes_fp, overwrite_fp, match_fp, error_fp, n_process=1, workers=1, resume=False):
+    """
+    workers: number of processes matching minutes in parallel
+    resume: skip minutes completed by the previous run that was interrupted, using the journal of results
+    """
 
-def main(clip_fp, minutes_fp, overwrite_fp, match_fp):
-    clip_df = pd.read_csv(clip_fp)
+    clip_df = read_table(clip_fp)
     LOGGER.info(f'loaded {len(clip_df)} clips')
 
-    minutes_df = pd.read_csv(minutes_fp)
+    minutes_df = read_table(minutes_fp)
     clip_df = pd.merge(clip_df, minutes_df[['minutes_id', 'session', 'meeting', 'issue']],
                        how='left', on=['session', 'meeting', 'issue'])
 
@@ -57,21 +108,37 @@ def main(clip_fp, minutes_fp, overwrite_fp, match_fp):
     if len(miss_df):
         LOGGER.warning('date mismatch found: ' + str(miss_df.to_dict(orient='records')))
 
-    records = []
-    for minutes_id, df in clip_df.groupby('minutes_id'):
+    # results of each minutes are journaled as soon as it completes,
+    # and are valid while the clips and speeches are unchanged
+    journal = Journal(journal_path(match_fp), to_fingerprint(
+        clip_df[['clip_id', 'name', 'title', 'minutes_id']].to_dict(orient='records'),
+        {minutes_id: to_speech_version(minutes_id) for minutes_id in clip_df['minutes_id'].dropna().unique()}
+    ))
+    done = journal.load() if resume else dict()
+    journal.open()
+    pending_df = clip_df[~clip_df['minutes_id'].isin(done)]
+
+    LOGGER.info(f'tokenizing {len(pending_df)} clips')
+    clip2tokens = tokenize(pending_df['clip_id'], pending_df['title'], n_process=n_process)
+
+    groups = []
+    for minutes_id, df in pending_df.groupby('minutes_id'):
         LOGGER.info(f'found {len(df)} clips for {minutes_id}')
-        minutes_record = load_minutes_record(minutes_id)
-        for _, clip in df.iterrows():
-            try:
-                speech_id, score = find_best_speech(clip['name'], clip['title'], minutes_record)
-                records.append({
-                    'clip_id': clip['clip_id'],
-                    'minutes_id': clip['minutes_id'],
-                    'speech_id': speech_id,
-                    'score': score
-                })
-            except Exception:
-                LOGGER.exception(f'failed to find match for clip_id={clip["clip_id"]}')
+        clip_ids = df['clip_id'].tolist()
+        clips = df[['clip_id', 'name']].to_dict(orient='records')
+        groups.append((minutes_id, clip_ids, (clips, [clip2tokens[clip_id] for clip_id in clip_ids])))
+    records, errors = run_groups(match_group, groups, workers=workers,
+                                 on_result=lambda key, *result: journal.append(key, result))
+    for group_records, group_errors in done.values():
+        records.extend(group_records)
+        errors.extend(group_errors)
+    records.sort(key=lambda x: x['clip_id'])
+    errors.sort(key=lambda x: x['clip_id'])
+
+    error_df = pd.DataFrame(errors, columns=['clip_id', 'minutes_id', 'error'])
+    write_table(error_df, error_fp)
+    if len(error_df):
+        LOGGER.warning(f'failed to match {len(error_df)} clips: {error_df["clip_id"].tolist()}')
 
     out_df = pd.DataFrame(records)
 
@@ -82,8 +149,9 @@ def main(clip_fp, minutes_fp, overwrite_fp, match_fp):
     out_df = out_df.sort_values(by=['clip_id', 'score'], ascending=[True, False])
     out_df.drop_duplicates('clip_id', keep='first', inplace=True)
 
-    out_df.to_csv(match_fp, index=False)
+    write_table(out_df, match_fp)
     LOGGER.info(f'saved {len(out_df)} records to {match_fp}')
+    journal.remove()
 
 
 if __name__ == '__main__':
@@ -92,5 +160,7 @@ if __name__ == '__main__':
         clip_fp='./out/clip.csv',
         minutes_fp='./out/minutes.csv',
         overwrite_fp='./data/clip_minutes.csv',
-        match_fp='./out/clip_minutes.csv'
+        match_fp='./out/clip_minutes.csv',
+        error_fp='./out/clip_minutes_error.csv',
+        resume=True
     )
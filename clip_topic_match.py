@@ -1,32 +1,31 @@
 import logging
 
 import pandas as pd
-from mylib.topic import is_match
 from tqdm import tqdm
 
+from mylib.table import read_table, write_table
+from mylib.topic import TopicMatcher
+
 LOGGER = logging.getLogger(__name__)
 
 
 def main(clip_fp, topic_fp, match_fp):
-    clip_df = pd.read_csv(clip_fp)
+    clip_df = read_table(clip_fp)
     LOGGER.info(f'loaded {len(clip_df)} clips')
     topic_df = pd.read_csv(topic_fp)
 
-    # all vs all comparison. maybe we can improve performance with TokenFinder
+    matcher = TopicMatcher(zip(topic_df['topic_id'], topic_df['query']))
     records = []
-    for _, clip in tqdm(clip_df.iterrows()):
-        topic_id_list = []
-        for _, topic in topic_df.iterrows():
-            if is_match(topic['query'], clip['title']):
-                topic_id_list.append(topic['topic_id'])
+    for clip_id, title in tqdm(zip(clip_df['clip_id'], clip_df['title'])):
+        topic_id_list = matcher.match(title)
         if topic_id_list:
             records.append({
-                'clip_id': clip['clip_id'],
-                'topic_id_list': ';'.join(map(str, topic_id_list))
+                'clip_id': clip_id,
+                'topic_id_list': topic_id_list
             })
 
     out_df = pd.DataFrame(records)
-    out_df.to_csv(match_fp, index=False)
+    write_table(out_df, match_fp)
     LOGGER.info(f'saved {len(out_df)} records to {match_fp}')
 
 
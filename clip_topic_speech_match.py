@@ -0,0 +1,89 @@
+import logging
+from collections import defaultdict
+
+import pandas as pd
+from tqdm import tqdm
+
+from mylib.canonicalize import canonicalize_speech
+from mylib.corpus import MinutesCorpus
+from mylib.table import read_table, write_table
+from mylib.topic import TopicMatcher
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ClipContext:
+    """
+    phrases found in the speeches shown in the clip page (see build_speech_list).
+    positions are offsets in the concatenated text of the speeches
+    """
+
+    def __init__(self):
+        self.length = 0
+        self.positions = defaultdict(list)  # key: phrase, val: list of start offset
+
+    def add(self, hits, length):
+        """
+        hits: list of (start, end, phrase) found in the next speech of the given length
+        """
+
+        for start, _, phrase in hits:
+            self.positions[phrase].append(self.length + start)
+        self.length += length
+
+
+def main(clip_fp, clip_minutes_fp, topic_fp, corpus_direc, match_fp, speech_count=2):
+    clip_df = read_table(clip_fp)
+    clip_minutes_df = read_table(clip_minutes_fp)
+    clip_df = pd.merge(clip_df[['clip_id']], clip_minutes_df[['clip_id', 'minutes_id', 'speech_id']], on='clip_id')
+    clip_df = clip_df.dropna(subset=['speech_id'])
+    topic_df = pd.read_csv(topic_fp)
+    matcher = TopicMatcher(zip(topic_df['topic_id'], topic_df['query']))
+
+    speech_clips = defaultdict(list)  # key: (minutes_id, speech_id), val: list of clip_id
+    for clip_id, minutes_id, speech_id in zip(clip_df['clip_id'], clip_df['minutes_id'], clip_df['speech_id']):
+        for idx in range(int(speech_id), int(speech_id) + speech_count):
+            speech_clips[(minutes_id, idx)].append(clip_id)
+    LOGGER.info(f'matching {len(topic_df)} topics against {len(speech_clips)} speeches of {len(clip_df)} clips')
+
+    # one pass over the corpus. speeches of each minutes come in order, so the context of each clip is built in order.
+    # neighbouring clips share speeches, so each speech is scanned once and its hits are added to all of its clips
+    corpus = MinutesCorpus(corpus_direc)
+    minutes_ids = [minutes_id for minutes_id in clip_df['minutes_id'].unique() if minutes_id in corpus]
+    contexts = defaultdict(ClipContext)  # key: clip_id
+    for minutes_id, speech_id, speech_record in tqdm(corpus.iter_speeches(minutes_ids)):
+        clip_ids = speech_clips.get((minutes_id, speech_id))
+        if not clip_ids:
+            continue
+        text = canonicalize_speech(speech_record)['normalized_text']  # queries are half-width like clip titles
+        hits = list(matcher.iter_phrases(text))
+        for clip_id in clip_ids:
+            contexts[clip_id].add(hits, len(text))
+    corpus.close()
+
+    records = []
+    for clip_id in sorted(contexts):
+        positions = contexts[clip_id].positions
+        for topic_id in matcher.match_phrases(positions.keys()):
+            position_list = sorted(x for phrase in matcher.topic_phrases[topic_id] for x in positions.get(phrase, []))
+            records.append({
+                'clip_id': clip_id,
+                'topic_id': topic_id,
+                'count': len(position_list),
+                'position_list': position_list
+            })
+
+    out_df = pd.DataFrame(records, columns=['clip_id', 'topic_id', 'count', 'position_list'])
+    write_table(out_df, match_fp)
+    LOGGER.info(f'saved {len(out_df)} records to {match_fp}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(
+        clip_fp='./out/clip.csv',
+        clip_minutes_fp='./out/clip_minutes.csv',
+        topic_fp='./data/topic.csv',
+        corpus_direc='./out/corpus',
+        match_fp='./out/clip_topic_speech.csv'
+    )
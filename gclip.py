@@ -7,11 +7,15 @@ from urllib.parse import urlparse
 
 import pandas as pd
 
+from mylib.table import write_table
+from mylib.transcript import Transcript
+
 LOGGER = logging.getLogger(__name__)
 
 
-def main(json_direc, csv_fp):
+def main(json_direc, csv_fp, transcript_direc):
     json_fps = glob.glob(str(Path(json_direc) / '*.json'))
+    Path(transcript_direc).mkdir(parents=True, exist_ok=True)
 
     records = []
     for fp in json_fps:
@@ -25,15 +29,25 @@ def main(json_direc, csv_fp):
         if 'minutes_url' in data:
             record['minutes_id'] = Path(urlparse(data['minutes_url']).path).stem
         records.append(record)
+        Transcript.from_record(Path(fp).stem, data).save(transcript_direc)
 
     df = pd.DataFrame(records)
-    df.to_csv(csv_fp, index=False)
+    write_table(df, csv_fp)
     LOGGER.info(f'saved {len(df)} records to {csv_fp}')
 
+    gclip_id_set = {Path(fp).stem for fp in json_fps}
+    for fp in Path(transcript_direc).glob('*.npy'):
+        if fp.stem not in gclip_id_set:
+            fp.unlink()
+            fp.with_suffix('.txt').unlink(missing_ok=True)
+            LOGGER.info(f'removed {fp}')
+    LOGGER.info(f'saved {len(json_fps)} transcripts to {transcript_direc}')
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     main(
         json_direc='./out/gclip',
         csv_fp='./out/gclip.csv',
+        transcript_direc='./out/transcript',
     )
@@ -3,6 +3,7 @@ import logging
 import pandas as pd
 
 from mylib.canonicalize import clean_text
+from mylib.table import write_table
 
 LOGGER = logging.getLogger(__name__)
 
@@ -23,7 +24,7 @@ def main(giin_fp, member_fp):
     member_df['name'] = member_df['name'].apply(clean_text)
     member_df['yomi'] = member_df['yomi'].apply(clean_text)
     member_df.index = member_df.index + 1
-    member_df.to_csv(member_fp, index_label='member_id')
+    write_table(member_df, member_fp, index_label='member_id')
     LOGGER.info(f'saved {len(member_df)} records to {member_fp}')
 
 
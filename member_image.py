@@ -2,9 +2,10 @@ import logging
 import time
 from pathlib import Path
 
-import pandas as pd
 import requests
 
+from mylib.table import read_table
+
 LOGGER = logging.getLogger(__name__)
 
 from PIL import Image
@@ -24,7 +25,7 @@ def crop_max_square(pil_img):
 
 
 def main(member_fp, image_direc):
-    member_df = pd.read_csv(member_fp)
+    member_df = read_table(member_fp)
     LOGGER.info(f'found {len(member_df)} members to process')
 
     for _, row in member_df.iterrows():
@@ -0,0 +1,56 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from mylib.similarity import iter_cosine_top_k
+from mylib.table import read_table, write_table
+from mylib.utils import flatten_id_list
+
+LOGGER = logging.getLogger(__name__)
+
+TOP_K = 5
+
+
+def main(clip_member_fp, clip_topic_fp, member_member_fp):
+    """
+    members are similar if their clips have the same topics. each member is a vector of clip counts per topic
+    weighted by IDF, so that topics discussed by most members count less, and the top k by cosine similarity are kept
+    """
+
+    clip_member_df = read_table(clip_member_fp)
+    clip_topic_df = read_table(clip_topic_fp)
+    clip_topic_df = flatten_id_list(clip_topic_df, 'topic_id_list', 'topic_id')
+    joined_df = pd.merge(clip_member_df, clip_topic_df, on='clip_id')
+
+    member_codes, member_ids = pd.factorize(joined_df['member_id'], sort=True)
+    topic_codes, topic_ids = pd.factorize(joined_df['topic_id'], sort=True)
+    count_mat = csr_matrix((np.ones(len(joined_df)), (member_codes, topic_codes)),
+                           shape=(len(member_ids), len(topic_ids)))
+    member_counts = np.bincount(count_mat.indices, minlength=len(topic_ids))  # duplicates are summed in csr_matrix
+    idf = np.log(len(member_ids) / np.maximum(member_counts, 1)) + 1
+    feature_mat = count_mat.multiply(idf[np.newaxis, :]).tocsr()
+    LOGGER.info(f'built features of {len(member_ids)} members over {len(topic_ids)} topics')
+
+    records = []
+    for i, columns, scores in iter_cosine_top_k(feature_mat, k=TOP_K, include_self=False):
+        is_related = scores > 0
+        records.append({
+            'member_id': member_ids[i],
+            'member_id_list': member_ids[columns[is_related]].tolist(),
+            'score_list': scores[is_related].tolist()
+        })
+
+    out_df = pd.DataFrame(records, columns=['member_id', 'member_id_list', 'score_list'])
+    write_table(out_df, member_member_fp)
+    LOGGER.info(f'saved {len(out_df)} records to {member_member_fp}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(
+        clip_member_fp='./out/clip_member.csv',
+        clip_topic_fp='./out/clip_topic.csv',
+        member_member_fp='./out/member_member.csv'
+    )
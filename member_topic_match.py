@@ -2,31 +2,24 @@ import logging
 
 import pandas as pd
 
+from mylib.table import read_table, write_table
 from mylib.utils import flatten_id_list
 
 LOGGER = logging.getLogger(__name__)
 
 
 def main(clip_member_fp, clip_topic_fp, member_topic_fp):
-    clip_member_df = pd.read_csv(clip_member_fp)
-    clip_topic_df = pd.read_csv(clip_topic_fp)
+    clip_member_df = read_table(clip_member_fp)
+    clip_topic_df = read_table(clip_topic_fp)
     clip_topic_df = flatten_id_list(clip_topic_df, 'topic_id_list', 'topic_id')
     joined_df = pd.merge(clip_member_df, clip_topic_df, on='clip_id')
 
-    records = []
-    for member_id, group_df in joined_df.groupby('member_id'):
-        group_df = group_df.sort_values(by='topic_id')
-        value_counts = group_df['topic_id'].value_counts()
-        topic_id_list = value_counts.index
-        clip_count_list = value_counts.values
-        records.append({
-            'member_id': member_id,
-            'topic_id_list': ';'.join(map(str, topic_id_list)),
-            'clip_count_list': ';'.join(map(str, clip_count_list))
-        })
-    out_df = pd.DataFrame(records)
-    out_df = out_df.sort_values(by='member_id')
-    out_df.to_csv(member_topic_fp, index=False)
+    # topics of each member in descending order of clip count. ties are broken by smaller topic_id
+    count_df = joined_df.groupby(['member_id', 'topic_id']).size().reset_index(name='clip_count')
+    count_df = count_df.sort_values(by=['member_id', 'clip_count', 'topic_id'], ascending=[True, False, True])
+    out_df = count_df.groupby('member_id').agg(topic_id_list=('topic_id', list),
+                                               clip_count_list=('clip_count', list)).reset_index()
+    write_table(out_df, member_topic_fp)
     LOGGER.info(f'saved {len(out_df)} records to {member_topic_fp}')
 
 
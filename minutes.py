@@ -6,6 +6,7 @@ from pathlib import Path
 import pandas as pd
 
 from mylib.canonicalize import extract_issue
+from mylib.table import write_table
 
 LOGGER = logging.getLogger(__name__)
 
@@ -29,7 +30,7 @@ def main(json_direc, csv_fp):
         records.append(record)
 
     df = pd.DataFrame(records)
-    df.to_csv(csv_fp, index=False)
+    write_table(df, csv_fp)
     LOGGER.info(f'saved {len(df)} records to {csv_fp}')
 
 
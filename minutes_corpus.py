@@ -0,0 +1,22 @@
+import glob
+import logging
+from pathlib import Path
+
+from mylib.corpus import MinutesCorpus
+
+LOGGER = logging.getLogger(__name__)
+
+
+def main(json_direc, corpus_direc):
+    json_fps = sorted(glob.glob(str(Path(json_direc) / '*.json')))
+    corpus = MinutesCorpus(corpus_direc)
+    corpus.update(json_fps)
+    LOGGER.info(f'packed {len(corpus.minutes_ids())} minutes into {corpus.data_fp}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(
+        json_direc='./out/minutes',
+        corpus_direc='./out/corpus',
+    )
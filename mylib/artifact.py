@@ -75,6 +75,7 @@ class ClipPage:
 class MemberPage:
     member: Member
     topics: Optional[list] = field(default=None, metadata=config(exclude=lambda x: x is None))
+    members: Optional[list] = field(default=None, metadata=config(exclude=lambda x: x is None))
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
@@ -33,3 +33,24 @@ def clean_text(text):
 
 def normalize_text(text):
     return unicodedata.normalize('NFKC', text)
+
+
+def canonicalize_speech(speech_record):
+    """
+    in: {'speechOrder': 5, 'speaker': '田中太郎', 'speech': '○田中太郎君　円安について...', ...}
+    out: {'speech_id': 5, 'speaker': '田中太郎', 'text': '円安について...', ...}
+    """
+
+    speech = speech_record['speech']
+    tokens = speech.split()
+    name_end = speech.find(tokens[0]) + len(tokens[0]) if tokens else 0
+    offset = speech.find(tokens[1], name_end) if len(tokens) > 1 else len(speech)  # start of text after the name
+    text = ''.join(tokens[1:])  # remove name
+    return {
+        'speech_id': speech_record['speechOrder'],
+        'speaker': speech_record['speaker'],
+        'speaker_info': speech_record['speakerPosition'] or speech_record['speakerGroup'],
+        'offset': offset,
+        'text': text,
+        'normalized_text': normalize_text(text)
+    }
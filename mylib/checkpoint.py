@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+from logging import getLogger
+from pathlib import Path
+
+LOGGER = getLogger(__name__)
+
+JOURNAL_DIREC = './out/cache'
+
+
+def journal_path(out_fp):
+    """
+    e.g. ./out/clip_minutes.csv -> ./out/cache/clip_minutes.journal.jsonl
+    """
+
+    return str(Path(JOURNAL_DIREC) / f'{Path(out_fp).stem}.journal.jsonl')
+
+
+def to_json_value(value):
+    return value.item() if hasattr(value, 'item') else str(value)  # numpy scalars
+
+
+def to_fingerprint(*values):
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=to_json_value).encode()).hexdigest()
+
+
+class Journal:
+    """
+    append-only JSON lines of the results of completed units (e.g. minutes_id), which lets an interrupted stage
+    resume without recomputing them. the first line holds the fingerprint of the inputs, and results recorded with a
+    different fingerprint are discarded
+    """
+
+    def __init__(self, fp, fingerprint):
+        self.fp = Path(fp)
+        self.fingerprint = fingerprint
+        self.units = dict()  # key: unit, val: result
+        self._valid_size = None  # bytes of complete lines, if the journal was loaded with the same fingerprint
+        self._file = None
+
+    def load(self):
+        """
+        results of the units completed in the previous run
+        """
+
+        if not self.fp.exists():
+            return dict()
+        with open(self.fp, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)
+        if not lines or not lines[0].endswith(b'\n') or json.loads(lines[0]).get('fingerprint') != self.fingerprint:
+            LOGGER.info(f'ignored {self.fp} recorded with different inputs')
+            return dict()
+        size = len(lines[0])
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:  # partially written when the process was killed
+                break
+            if not line.endswith(b'\n'):
+                break
+            self.units[entry['unit']] = entry['result']
+            size += len(line)
+        self._valid_size = size
+        LOGGER.info(f'resuming {len(self.units)} units from {self.fp}')
+        return dict(self.units)
+
+    def open(self):
+        """
+        start recording. a journal loaded by load() is appended to, otherwise a new one replaces the old one
+        """
+
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        if self._valid_size is not None:
+            os.truncate(self.fp, self._valid_size)  # drop the partially written line
+        else:
+            tmp_fp = self.fp.with_name(self.fp.name + '.tmp')
+            with open(tmp_fp, 'w') as f:
+                f.write(json.dumps({'fingerprint': self.fingerprint}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_fp, self.fp)
+        self._file = open(self.fp, 'a')
+        return self
+
+    def append(self, unit, result):
+        self.units[unit] = result
+        self._write({'unit': unit, 'result': result})
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=to_json_value) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def remove(self):
+        """
+        delete the journal after the final output is written
+        """
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.fp.unlink(missing_ok=True)
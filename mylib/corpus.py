@@ -0,0 +1,166 @@
+import hashlib
+import json
+import mmap
+import os
+from logging import getLogger
+from pathlib import Path
+
+LOGGER = getLogger(__name__)
+
+CORPUS_DIREC = './out/corpus'
+DATA_FILE = 'minutes.bin'  # concatenation of JSON-encoded speech records
+INDEX_FILE = 'minutes.idx.json'  # byte offsets of each speech record in DATA_FILE
+
+
+class MinutesCorpus:
+    """
+    all speech records of ./out/minutes packed into one file, which allows random access by (minutes_id, speech_id)
+    without parsing the whole minutes
+    """
+
+    def __init__(self, direc=CORPUS_DIREC):
+        self.direc = Path(direc)
+        self.data_fp = self.direc / DATA_FILE
+        self.index_fp = self.direc / INDEX_FILE
+        self.index = {'minutes': dict(), 'garbage': 0}  # minutes: key: minutes_id, val: source_hash and offsets
+        if self.index_fp.exists():
+            with open(self.index_fp, 'r') as f:
+                self.index = json.load(f)
+        self._file = None
+        self._mmap = None
+
+    @property
+    def mm(self):
+        if self._mmap is None:
+            self._file = open(self.data_fp, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._mmap = None
+        self._file = None
+
+    def __contains__(self, minutes_id):
+        return minutes_id in self.index['minutes']
+
+    def minutes_ids(self):
+        return list(self.index['minutes'])
+
+    def source_hash(self, minutes_id):
+        return self.index['minutes'][minutes_id]['source_hash']
+
+    def speech_count(self, minutes_id):
+        return len(self.index['minutes'][minutes_id]['offsets']) - 1
+
+    def get(self, minutes_id, speech_id):
+        offsets = self.index['minutes'][minutes_id]['offsets']
+        return json.loads(self.mm[offsets[speech_id]: offsets[speech_id + 1]])
+
+    def get_text(self, minutes_id, speech_id):
+        return self.get(minutes_id, speech_id)['speech']
+
+    def iter_speeches(self, minutes_ids=None):
+        """
+        stream (minutes_id, speech_id, speech record) over the corpus in file order
+        """
+
+        if minutes_ids is None:
+            minutes_ids = self.index['minutes'].keys()
+        minutes_ids = sorted(minutes_ids, key=lambda x: self.index['minutes'][x]['offsets'][0])
+        for minutes_id in minutes_ids:
+            offsets = self.index['minutes'][minutes_id]['offsets']
+            for speech_id, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+                yield minutes_id, speech_id, json.loads(self.mm[start: end])
+
+    def update(self, minutes_fps, compact_ratio=0.5):
+        """
+        append minutes whose content has changed and drop minutes that no longer exist.
+        the data file is rewritten when more than compact_ratio of it is occupied by dropped records
+        """
+
+        self.close()
+        self.direc.mkdir(parents=True, exist_ok=True)
+        minutes_map = self.index['minutes']
+        size = self.data_fp.stat().st_size if self.data_fp.exists() else 0
+
+        minutes_id_set = set()
+        update_count = 0
+        with open(self.data_fp, 'ab') as f:
+            for fp in minutes_fps:
+                with open(fp, 'rb') as g:
+                    content = g.read()
+                minutes_id = Path(fp).stem
+                minutes_id_set.add(minutes_id)
+                source_hash = hashlib.sha1(content).hexdigest()  # same as hash of the minutes file
+                if minutes_id in minutes_map and minutes_map[minutes_id]['source_hash'] == source_hash:
+                    continue
+
+                if minutes_id in minutes_map:
+                    self.drop(minutes_id)
+                offsets = [size]
+                for speech_record in json.loads(content)['speechRecord']:
+                    data = json.dumps(speech_record, ensure_ascii=False).encode()
+                    f.write(data)
+                    size += len(data)
+                    offsets.append(size)
+                minutes_map[minutes_id] = {'source_hash': source_hash, 'offsets': offsets}
+                update_count += 1
+
+        for minutes_id in set(minutes_map) - minutes_id_set:
+            self.drop(minutes_id)
+
+        if size and self.index['garbage'] > size * compact_ratio:
+            self.compact()
+        self.save_index()
+        LOGGER.info(f'updated {update_count} of {len(minutes_id_set)} minutes in {self.data_fp}')
+
+    def drop(self, minutes_id):
+        offsets = self.index['minutes'].pop(minutes_id)['offsets']
+        self.index['garbage'] += offsets[-1] - offsets[0]
+
+    def compact(self):
+        """
+        rewrite the data file without dropped records
+        """
+
+        tmp_fp = self.data_fp.with_suffix('.tmp')
+        size = 0
+        with open(tmp_fp, 'wb') as f:
+            for minutes_id in sorted(self.index['minutes'], key=lambda x: self.index['minutes'][x]['offsets'][0]):
+                offsets = self.index['minutes'][minutes_id]['offsets']
+                f.write(self.mm[offsets[0]: offsets[-1]])
+                self.index['minutes'][minutes_id]['offsets'] = [x - offsets[0] + size for x in offsets]
+                size += offsets[-1] - offsets[0]
+        self.close()
+        os.replace(tmp_fp, self.data_fp)
+        LOGGER.info(f'compacted {self.data_fp}: dropped {self.index["garbage"]} bytes')
+        self.index['garbage'] = 0
+
+    def save_index(self):
+        tmp_fp = self.index_fp.with_suffix('.tmp')
+        with open(tmp_fp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_fp, self.index_fp)
+
+
+_corpus = None
+
+
+def open_corpus(direc=CORPUS_DIREC):
+    """
+    shared MinutesCorpus, reopened when the index is rewritten
+    """
+
+    global _corpus
+    index_fp = Path(direc) / INDEX_FILE
+    if not index_fp.exists():
+        raise FileNotFoundError(f'{index_fp} not found. run minutes_corpus.py first')
+    key = (str(direc), index_fp.stat().st_mtime_ns)
+    if _corpus is None or _corpus[0] != key:
+        if _corpus is not None:
+            _corpus[1].close()
+        _corpus = (key, MinutesCorpus(direc))
+    return _corpus[1]
@@ -0,0 +1,183 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from functools import lru_cache
+from logging import getLogger
+from pathlib import Path
+
+import spacy
+
+from mylib.canonicalize import normalize_text
+from mylib.utils import to_token_set
+
+LOGGER = getLogger(__name__)
+
+MODEL_NAME = 'ja_ginza'
+PIPES = ['parser']  # components enabled when tokenizing titles
+
+Token = namedtuple('Token', ['text', 'pos_'])  # quacks like spacy.tokens.Token for to_token_list
+
+
+@lru_cache(maxsize=None)
+def load_nlp(name=MODEL_NAME):
+    """
+    load spaCy model once per process
+    """
+
+    return spacy.load(name)
+
+
+class TokenCache:
+    """
+    disk-backed cache of tokenization results keyed by hash of normalized text and model version
+    """
+
+    def __init__(self, fp, max_entries=200000, model_name=MODEL_NAME):
+        self.fp = fp
+        self.max_entries = max_entries
+        self.model_name = model_name
+        self.hit_count = 0
+        self.miss_count = 0
+        self.put_count = 0
+        self._pid = None
+        self._conn = None
+        self._model_key = None
+        self._accessed = []  # keys hit since the last flush
+
+    @property
+    def conn(self):
+        if self._pid != os.getpid():  # do not share sqlite connection with forked processes
+            Path(self.fp).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.fp, timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS token '
+                               '(key TEXT PRIMARY KEY, tokens TEXT NOT NULL, accessed REAL NOT NULL)')
+            self._pid = os.getpid()
+        return self._conn
+
+    @property
+    def model_key(self):
+        if self._model_key is None:
+            version = spacy.util.get_package_version(self.model_name) or load_nlp(self.model_name).meta['version']
+            self._model_key = '{}-{}:{}'.format(self.model_name, version, ','.join(PIPES))
+        return self._model_key
+
+    def to_key(self, text):
+        return hashlib.sha1(f'{self.model_key}\t{text}'.encode()).hexdigest()
+
+    def get_many(self, texts, chunk_size=500):
+        """
+        key: text, val: list of tokens. texts not in the cache are omitted
+        """
+
+        key_map = {self.to_key(text): text for text in texts}
+        keys = list(key_map)
+        result = dict()
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i: i + chunk_size]
+            rows = self.conn.execute('SELECT key, tokens FROM token WHERE key IN ({})'.format(
+                ','.join('?' * len(chunk))), chunk).fetchall()
+            for key, tokens in rows:
+                result[key_map[key]] = [Token(*token) for token in json.loads(tokens)]
+                self._accessed.append(key)
+        self.hit_count += len(result)
+        self.miss_count += len(key_map) - len(result)
+        self.flush()
+        return result
+
+    def put_many(self, token_map):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO token VALUES (?, ?, ?)', [
+                (self.to_key(text), json.dumps(tokens, ensure_ascii=False), now)
+                for text, tokens in token_map.items()])
+        prev_count = self.put_count
+        self.put_count += len(token_map)
+        if self.put_count // 1000 > prev_count // 1000:
+            self.evict()
+
+    def flush(self):
+        """
+        record access time of cache hits, which is used for eviction
+        """
+
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('UPDATE token SET accessed = ? WHERE key = ?', [(now, key) for key in self._accessed])
+        self._accessed = []
+
+    def evict(self):
+        """
+        delete least recently used entries exceeding max_entries
+        """
+
+        with self.conn:
+            cursor = self.conn.execute(
+                'DELETE FROM token WHERE key IN '
+                '(SELECT key FROM token ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        if cursor.rowcount > 0:
+            LOGGER.info(f'evicted {cursor.rowcount} entries from {self.fp}')
+
+    def parse_many(self, texts, batch_size=256, n_process=1):
+        """
+        tokenize texts in batches with nlp.pipe. only texts missing in the cache are parsed
+        """
+
+        texts = [normalize_text(text) for text in texts]
+        token_map = self.get_many(set(texts))
+        missed = [text for text in set(texts) if text not in token_map]
+        if missed:
+            LOGGER.debug(f'parsing {len(missed)} texts with {n_process} processes')
+            nlp = load_nlp(self.model_name)
+            with nlp.select_pipes(enable=PIPES):
+                docs = nlp.pipe(missed, batch_size=batch_size, n_process=n_process)
+                missed_map = {text: [Token(token.text, token.pos_) for token in doc]
+                              for text, doc in zip(missed, docs)}
+            self.put_many(missed_map)
+            token_map.update(missed_map)
+        return [token_map[text] for text in texts]
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self.flush()
+            if self.put_count:
+                self.evict()
+            if self.hit_count or self.miss_count:
+                LOGGER.info(f'token cache: {self.hit_count} hits, {self.miss_count} misses')
+            self._conn.close()
+        self._conn = None
+        self._pid = None
+
+
+_token_cache = TokenCache('./out/cache/token.sqlite')
+atexit.register(_token_cache.close)
+
+
+def parse(text):
+    """
+    tokenize text with ja_ginza (parser only), reusing cached results across runs
+    """
+
+    return _token_cache.parse_many([text])[0]
+
+
+def parse_many(texts, batch_size=256, n_process=1):
+    """
+    batched version of parse. returns list of tokens aligned with texts
+    """
+
+    return _token_cache.parse_many(texts, batch_size, n_process)
+
+
+def tokenize(id_list, text_list, batch_size=256, n_process=1):
+    """
+    key: id, val: set of content words in the text. e.g. clip_id -> tokens of the clip title
+    """
+
+    token_lists = parse_many(list(text_list), batch_size, n_process)
+    return {id_: to_token_set(tokens) for id_, tokens in zip(id_list, token_lists)}
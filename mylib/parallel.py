@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging import getLogger
+
+LOGGER = getLogger(__name__)
+
+
+def run_groups(func, groups, workers=1, key_name='minutes_id', initializer=None, initargs=(), on_result=None):
+    """
+    run func(key, *args) for each (key, clip_ids, args) in groups, on a process pool if workers > 1.
+    func returns (records, errors) as lists of dicts with clip_id.
+    groups are submitted from the largest to balance workers, and the results are merged in clip_id order.
+    if func raises, all clip_ids of the group are reported in errors instead of aborting the other groups.
+    on_result(key, records, errors) is called in the main process as each group completes without raising
+    """
+
+    groups = sorted(groups, key=lambda x: len(x[1]), reverse=True)
+    records, errors = [], []
+
+    def collect(key, clip_ids, get_result):
+        try:
+            group_records, group_errors = get_result()
+        except Exception as e:
+            LOGGER.exception(f'failed to process {key_name}={key}')
+            group_records = []
+            group_errors = [{'clip_id': clip_id, key_name: key, 'error': repr(e)} for clip_id in clip_ids]
+        else:
+            if on_result:
+                on_result(key, group_records, group_errors)
+        records.extend(group_records)
+        errors.extend(group_errors)
+
+    if workers <= 1:
+        if initializer:
+            initializer(*initargs)
+        for key, clip_ids, args in groups:
+            collect(key, clip_ids, lambda: func(key, *args))
+    else:
+        LOGGER.info(f'processing {len(groups)} groups with {workers} processes')
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+            futures = {executor.submit(func, key, *args): (key, clip_ids) for key, clip_ids, args in groups}
+            for future in as_completed(futures):
+                key, clip_ids = futures[future]
+                collect(key, clip_ids, future.result)
+
+    records.sort(key=lambda x: x['clip_id'])
+    errors.sort(key=lambda x: x['clip_id'])
+    return records, errors
@@ -0,0 +1,420 @@
+import hashlib
+import importlib
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from logging import getLogger
+from pathlib import Path
+
+from mylib.table import enable_memory, disable_memory, table_path
+
+LOGGER = getLogger(__name__)
+
+LIB_DIREC = './mylib'
+
+
+@dataclass
+class Stage:
+    name: str  # script name without .py, e.g. clip_topic_match
+    args: dict  # keyword arguments of main()
+    outputs: list  # keys of args written by the stage
+    extra_inputs: list = field(default_factory=list)  # paths read by the stage but not passed to main()
+    optional: bool = False  # only run when selected as a target
+
+    @property
+    def script(self):
+        return f'{self.name}.py'
+
+    @property
+    def input_paths(self):
+        paths = [path for key, path in self.args.items()
+                 if key not in self.outputs and key.endswith(('_fp', '_direc'))]
+        return paths + self.extra_inputs
+
+    @property
+    def output_paths(self):
+        return [self.args[key] for key in self.outputs]
+
+
+STAGES = [
+    Stage('clip', dict(
+        jsonl_fp='./out/shitsugi.jl',
+        csv_fp='./out/clip.csv'
+    ), outputs=['csv_fp']),
+    Stage('minutes', dict(
+        json_direc='./out/minutes',
+        csv_fp='./out/minutes.csv',
+    ), outputs=['csv_fp']),
+    Stage('member', dict(
+        giin_fp='./data/giin.csv',
+        member_fp='./out/member.csv',
+    ), outputs=['member_fp']),
+    Stage('minutes_corpus', dict(
+        json_direc='./out/minutes',
+        corpus_direc='./out/corpus',
+    ), outputs=['corpus_direc']),
+    Stage('speech', dict(
+        corpus_direc='./out/corpus',
+        speech_direc='./out/speech',
+    ), outputs=['speech_direc']),
+    Stage('gclip', dict(
+        json_direc='./out/gclip',
+        csv_fp='./out/gclip.csv',
+        transcript_direc='./out/transcript',
+    ), outputs=['csv_fp', 'transcript_direc']),
+    Stage('clip_topic_match', dict(
+        clip_fp='./out/clip.csv',
+        topic_fp='./data/topic.csv',
+        match_fp='./out/clip_topic.csv'
+    ), outputs=['match_fp']),
+    Stage('clip_category_match', dict(
+        clip_fp='./out/clip.csv',
+        category_fp='./data/category_annotation.csv',
+        match_fp='./out/clip_category.csv'
+    ), outputs=['match_fp']),
+    Stage('topic', dict(
+        data_fp='./data/topic.csv',
+        clip_topic_fp='./out/clip_topic.csv',
+        clip_category_fp='./out/clip_category.csv',
+        out_fp='./out/topic.csv'
+    ), outputs=['out_fp']),
+    Stage('clip_minutes_match', dict(
+        clip_fp='./out/clip.csv',
+        minutes_fp='./out/minutes.csv',
+        overwrite_fp='./data/clip_minutes.csv',
+        match_fp='./out/clip_minutes.csv',
+        error_fp='./out/clip_minutes_error.csv',
+        resume=True
+    ), outputs=['match_fp', 'error_fp'], extra_inputs=['./out/speech']),
+    Stage('clip_member_match', dict(
+        clip_fp='./out/clip.csv',
+        member_fp='./out/member.csv',
+        match_fp='./out/clip_member.csv'
+    ), outputs=['match_fp']),
+    Stage('clip_gclip_match', dict(
+        clip_fp='./out/clip.csv',
+        clip_minutes_fp='./out/clip_minutes.csv',
+        gclip_fp='./out/gclip.csv',
+        clip_gclip_fp='./out/clip_gclip.csv',
+        error_fp='./out/clip_gclip_error.csv'
+    ), outputs=['clip_gclip_fp', 'error_fp'], extra_inputs=['./out/speech', './out/transcript']),
+    Stage('clip_clip_match', dict(
+        clip_fp='./out/clip.csv',
+        clip_minutes_fp='./out/clip_minutes.csv',
+        clip_clip_fp='./out/clip_clip.csv',
+        state_fp='./out/clip_clip_state.json',
+        incremental=True,
+        resume=True
+    ), outputs=['clip_clip_fp', 'state_fp'], extra_inputs=['./out/speech']),
+    Stage('clip_topic_speech_match', dict(
+        clip_fp='./out/clip.csv',
+        clip_minutes_fp='./out/clip_minutes.csv',
+        topic_fp='./data/topic.csv',
+        corpus_direc='./out/corpus',
+        match_fp='./out/clip_topic_speech.csv'
+    ), outputs=['match_fp'], optional=True),
+    Stage('member_topic_match', dict(
+        clip_topic_fp='./out/clip_topic.csv',
+        clip_member_fp='./out/clip_member.csv',
+        member_topic_fp='./out/member_topic.csv'
+    ), outputs=['member_topic_fp']),
+    Stage('member_member_match', dict(
+        clip_member_fp='./out/clip_member.csv',
+        clip_topic_fp='./out/clip_topic.csv',
+        member_member_fp='./out/member_member.csv'
+    ), outputs=['member_member_fp']),
+    Stage('topic_topic_match', dict(
+        clip_fp='./out/clip.csv',
+        topic_fp='./out/topic.csv',
+        clip_topic_fp='./out/clip_topic.csv',
+        topic_topic_fp='./out/topic_topic.csv'
+    ), outputs=['topic_topic_fp']),
+    Stage('build_artifact_clip', dict(
+        clip_fp='./out/clip.csv',
+        member_fp='./out/member.csv',
+        topic_fp='./out/topic.csv',
+        clip_minutes_fp='./out/clip_minutes.csv',
+        clip_gclip_fp='./out/clip_gclip.csv',
+        clip_clip_fp='./out/clip_clip.csv',
+        clip_member_fp='./out/clip_member.csv',
+        clip_category_fp='./out/clip_category.csv',
+        clip_topic_fp='./out/clip_topic.csv',
+        artifact_direc='./out/artifact/clip'
+    ), outputs=['artifact_direc'], extra_inputs=['./out/corpus']),
+    Stage('build_artifact_member', dict(
+        member_fp='./out/member.csv',
+        topic_fp='./out/topic.csv',
+        member_topic_fp='./out/member_topic.csv',
+        member_member_fp='./out/member_member.csv',
+        artifact_direc='./out/artifact/member'
+    ), outputs=['artifact_direc']),
+    Stage('build_artifact_topic', dict(
+        topic_fp='./out/topic.csv',
+        topic_topic_fp='./out/topic_topic.csv',
+        artifact_direc='./out/artifact/topic'
+    ), outputs=['artifact_direc']),
+    Stage('build_artifact_category', dict(
+        category_fp='./data/category.csv',
+        topic_fp='./out/topic.csv',
+        artifact_direc='./out/artifact/category'
+    ), outputs=['artifact_direc']),
+    Stage('build_artifact_home', dict(
+        clip_fp='./out/clip.csv',
+        category_fp='./data/category.csv',
+        clip_category_fp='./out/clip_category.csv',
+        clip_artifact_direc='./out/artifact/clip',
+        category_artifact_direc='./out/artifact/category',
+        artifact_fp='./out/artifact/home/home.json'
+    ), outputs=['artifact_fp']),
+]
+
+
+def hash_path(path, pattern='*'):
+    """
+    content hash of a file, or of every file under a directory. None if the path does not exist
+    """
+
+    path = Path(path)
+    if path.is_file():
+        fps = [path]
+    elif path.is_dir():
+        fps = sorted(fp for fp in path.rglob(pattern) if fp.is_file())
+    else:
+        return None
+
+    h = hashlib.sha1()
+    for fp in fps:
+        h.update(str(fp.relative_to(path)).encode())
+        with open(fp, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def get_upstream_map(stages):
+    """
+    key: stage name, val: set of stage names producing its inputs
+    """
+
+    producer_map = dict()
+    for stage in stages:
+        for path in stage.output_paths:
+            producer_map[path] = stage.name
+    return {stage.name: {producer_map[path] for path in stage.input_paths if path in producer_map}
+            for stage in stages}
+
+
+def sort_stages(stages):
+    """
+    topological sort based on the declared inputs and outputs
+    """
+
+    upstream_map = get_upstream_map(stages)
+    stage_map = {stage.name: stage for stage in stages}
+    visited = set()
+    result = []
+
+    def visit(name, trail):
+        if name in visited:
+            return
+        if name in trail:
+            raise ValueError(f'cyclic dependency detected: {trail + [name]}')
+        for upstream in sorted(upstream_map[name]):
+            visit(upstream, trail + [name])
+        visited.add(name)
+        result.append(stage_map[name])
+
+    for stage in stages:
+        visit(stage.name, [])
+    return result
+
+
+@dataclass
+class Pipeline:
+    stages: list
+    state_fp: str = './out/.pipeline.json'
+    state: dict = field(default_factory=dict)  # key: stage name, val: fingerprint of the last successful run
+    hash_cache: dict = field(default_factory=dict)  # key: path, val: content hash
+
+    def __post_init__(self):
+        self.stages = sort_stages(self.stages)
+        self.table_paths = {path for stage in self.stages for path in stage.output_paths if path.endswith('.csv')}
+        if Path(self.state_fp).exists():
+            with open(self.state_fp, 'r') as f:
+                self.state = json.load(f)
+
+    def save_state(self):
+        Path(self.state_fp).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_fp, 'w') as f:
+            json.dump(self.state, f, indent=2)
+
+    def resolve(self, path):
+        """
+        actual location of the path, as tables may be stored in a format other than CSV
+        """
+
+        return table_path(path) if path in self.table_paths else path
+
+    def hash(self, path, pattern='*'):
+        if path not in self.hash_cache:
+            self.hash_cache[path] = hash_path(self.resolve(path), pattern)
+        return self.hash_cache[path]
+
+    def fingerprint(self, stage):
+        fingerprint = {path: self.hash(path) for path in stage.input_paths}
+        fingerprint[stage.script] = self.hash(stage.script)
+        fingerprint[LIB_DIREC] = self.hash(LIB_DIREC, '*.py')
+        return fingerprint
+
+    def is_fresh(self, stage, fingerprint):
+        if any(not Path(self.resolve(path)).exists() for path in stage.output_paths):
+            return False
+        return self.state.get(stage.name) == fingerprint
+
+    def select(self, targets):
+        """
+        select target stages together with their upstream stages
+        """
+
+        if not targets:
+            return [stage for stage in self.stages if not stage.optional]
+
+        upstream_map = get_upstream_map(self.stages)
+        unknown = set(targets) - set(upstream_map)
+        if unknown:
+            raise ValueError(f'unknown stages: {unknown}')
+
+        selected = set()
+        queue = list(targets)
+        while queue:
+            name = queue.pop()
+            if name not in selected:
+                selected.add(name)
+                queue.extend(upstream_map[name])
+        return [stage for stage in self.stages if stage.name in selected]
+
+    def commit(self, stage, fingerprint):
+        for path in stage.output_paths:
+            self.hash_cache.pop(path, None)
+        self.state[stage.name] = fingerprint
+        self.save_state()
+
+    def run(self, targets=None, force=False, workers=1):
+        """
+        run stages whose inputs have changed, up to `workers` stages at a time.
+        return the list of executed stage names
+        """
+
+        stages = self.select(targets)
+        stage_map = {stage.name: stage for stage in stages}
+        upstream_map = get_upstream_map(stages)
+
+        pending = [stage.name for stage in stages]
+        duration_map = dict()  # key: stage name, val: elapsed seconds (0 if skipped)
+        executed = []
+        running = dict()  # key: future, val: (stage name, fingerprint)
+        failed = []
+        start = time.time()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or running:
+                ready = [name for name in pending if upstream_map[name] <= duration_map.keys()]
+                while ready and not failed:
+                    name = ready.pop(0)
+                    pending.remove(name)
+                    stage = stage_map[name]
+                    fingerprint = self.fingerprint(stage)
+                    if not force and self.is_fresh(stage, fingerprint):
+                        LOGGER.info(f'skip {name}: inputs are unchanged')
+                        duration_map[name] = 0
+                        ready = [name for name in pending if upstream_map[name] <= duration_map.keys()]
+                        continue
+                    running[executor.submit(run_stage, stage)] = (name, fingerprint)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, fingerprint = running.pop(future)
+                    try:
+                        duration_map[name] = future.result()
+                    except subprocess.CalledProcessError:
+                        LOGGER.error(f'failed {name}')
+                        failed.append(name)
+                        continue
+                    LOGGER.info(f'finished {name} in {duration_map[name]:.1f}s')
+                    self.commit(stage_map[name], fingerprint)
+                    executed.append(name)
+
+        LOGGER.info(f'executed {len(executed)} stages: {executed}')
+        if failed:
+            raise RuntimeError(f'failed stages: {failed}')
+        if executed:
+            log_critical_path(stages, upstream_map, duration_map, time.time() - start)
+        return executed
+
+    def run_in_memory(self, targets=None, force=False, materialize=False):
+        """
+        call main() of every stage in this process, handing tables between stages in memory.
+        fresh stages are skipped only if tables are materialized, as otherwise the files on disk may be outdated
+        """
+
+        enable_memory(materialize)
+        executed = []
+        try:
+            for stage in self.select(targets):
+                fingerprint = self.fingerprint(stage) if materialize else None
+                if materialize and not force and self.is_fresh(stage, fingerprint):
+                    LOGGER.info(f'skip {stage.name}: inputs are unchanged')
+                    continue
+
+                LOGGER.info(f'run {stage.name} in memory')
+                start = time.time()
+                importlib.import_module(stage.name).main(**stage.args)
+                LOGGER.info(f'finished {stage.name} in {time.time() - start:.1f}s')
+
+                if materialize:
+                    self.commit(stage, fingerprint)
+                executed.append(stage.name)
+        finally:
+            disable_memory()
+
+        LOGGER.info(f'executed {len(executed)} stages: {executed}')
+        return executed
+
+
+def run_stage(stage):
+    LOGGER.info(f'run {stage.name}')
+    start = time.time()
+    subprocess.run([sys.executable, stage.script], check=True)
+    return time.time() - start
+
+
+def find_critical_path(stages, upstream_map, duration_map):
+    """
+    return the chain of stages with the longest total duration. stages must be topologically sorted
+    """
+
+    finish_map = dict()  # key: stage name, val: (earliest finish time, upstream stage on the path)
+    for stage in stages:
+        prev = max(upstream_map[stage.name], key=lambda x: finish_map[x][0], default=None)
+        offset = finish_map[prev][0] if prev else 0
+        finish_map[stage.name] = (offset + duration_map[stage.name], prev)
+
+    path = []
+    name = max(finish_map, key=lambda x: finish_map[x][0], default=None)
+    while name:
+        path.append(name)
+        name = finish_map[name][1]
+    return path[::-1]
+
+
+def log_critical_path(stages, upstream_map, duration_map, elapsed):
+    path = find_critical_path(stages, upstream_map, duration_map)
+    LOGGER.info('critical path: ' + ' -> '.join(f'{name} ({duration_map[name]:.1f}s)' for name in path))
+    LOGGER.info('critical path {:.1f}s, sum of stages {:.1f}s, wall clock {:.1f}s'.format(
+        sum(duration_map[name] for name in path), sum(duration_map.values()), elapsed))
@@ -0,0 +1,248 @@
+from logging import getLogger
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+LOGGER = getLogger(__name__)
+
+MAX_CHUNK_CELLS = 1 << 24  # cells of the dense score matrix materialized at once (128MB of float64)
+
+
+def build_vocabulary(token_sets):
+    """
+    key: token, val: column index. tokens are sorted to keep the columns stable between runs
+    """
+
+    all_tokens = set()
+    for token_set in token_sets:
+        all_tokens.update(token_set)
+    return {token: i for i, token in enumerate(sorted(all_tokens))}
+
+
+def to_csr(token_sets, vocabulary):
+    """
+    binary matrix of len(token_sets) x len(vocabulary). tokens missing in the vocabulary are ignored
+    """
+
+    indptr = [0]
+    indices = []
+    for token_set in token_sets:
+        indices.extend(sorted(vocabulary[token] for token in token_set if token in vocabulary))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int32)
+    return csr_matrix((data, indices, indptr), shape=(len(token_sets), len(vocabulary)))
+
+
+def top_k(scores, k):
+    """
+    column indices of the k largest scores in descending order. ties are broken by larger index first
+    """
+
+    k = min(k, len(scores))
+    kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    upper = np.flatnonzero(scores > kth)
+    upper = upper[np.lexsort((-upper, -scores[upper]))]
+    ties = np.flatnonzero(scores == kth)[::-1][:k - len(upper)]
+    return np.concatenate([upper, ties])
+
+
+def to_chunk_size(n_columns, max_cells=MAX_CHUNK_CELLS):
+    """
+    number of rows of a dense matrix with n_columns that fit in max_cells
+    """
+
+    return max(1, max_cells // max(1, n_columns))
+
+
+def iter_overlap_top_k(src_mat, trg_mat, k=5, max_cells=MAX_CHUNK_CELLS):
+    """
+    for each row of src_mat, yield (row, columns, scores) of the k rows of trg_mat sharing the largest fraction
+    of the tokens of the row. only max_cells cells of the score matrix are materialized at once
+    """
+
+    src_sizes = np.asarray(src_mat.sum(axis=1)).ravel()
+    trg_mat_t = trg_mat.T.tocsr()  # built once, as csr @ csc would convert it on every chunk
+    chunk_size = to_chunk_size(trg_mat.shape[0], max_cells)
+    for start in range(0, src_mat.shape[0], chunk_size):
+        end = min(start + chunk_size, src_mat.shape[0])
+        scores = (src_mat[start:end].astype(np.float64) @ trg_mat_t).toarray()
+        sizes = src_sizes[start:end, np.newaxis]
+        np.divide(scores, sizes, out=scores, where=sizes > 0)  # rows without tokens have no overlap and stay 0
+        for i in range(end - start):
+            columns = top_k(scores[i], k)
+            yield start + i, columns, scores[i][columns]
+
+
+def normalize_rows(mat):
+    """
+    scale each row of mat to unit L2 norm. rows without non-zero values are left as zero
+    """
+
+    mat = csr_matrix(mat, dtype=np.float64)
+    norms = np.sqrt(np.asarray(mat.multiply(mat).sum(axis=1)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (diags(scale) @ mat).tocsr()
+
+
+def iter_cosine_top_k(mat, k=5, max_cells=MAX_CHUNK_CELLS, include_self=True, normalize=True):
+    """
+    for each row of mat, yield (row, columns, scores) of the k rows with the largest cosine similarity.
+    the row itself scores 1 (even if it has no non-zero values) if include_self, otherwise it is excluded.
+    if not normalize, rows are assumed to be normalized and scores are their dot products.
+    only max_cells cells of the score matrix are materialized at once
+    """
+
+    norm_mat = normalize_rows(mat) if normalize else csr_matrix(mat, dtype=np.float64)
+    norm_mat_t = norm_mat.T.tocsr()
+    chunk_size = to_chunk_size(norm_mat.shape[0], max_cells)
+    for start in range(0, norm_mat.shape[0], chunk_size):
+        end = min(start + chunk_size, norm_mat.shape[0])
+        scores = (norm_mat[start:end] @ norm_mat_t).toarray()
+        rows = np.arange(end - start)
+        scores[rows, start + rows] = 1.0 if include_self else -np.inf
+        for i in range(end - start):
+            columns = top_k(scores[i], k)
+            columns = columns[scores[i][columns] > -np.inf]
+            yield start + i, columns, scores[i][columns]
+
+
+def iter_candidate_top_k(src_mat, trg_mat, k=5, max_postings=1000, min_idf=0.0):
+    """
+    same as iter_overlap_top_k, but only rows of trg_mat sharing at least one token with the source are scored.
+    candidates are collected from the posting list (token -> rows of trg_mat) of each source token, skipping tokens
+    with more than max_postings rows or idf below min_idf. fewer than k rows are returned if candidates are scarce
+    """
+
+    postings = trg_mat.tocsc()
+    doc_freqs = np.diff(postings.indptr)
+    idf = np.log(trg_mat.shape[0] / np.maximum(doc_freqs, 1))
+    is_usable = (doc_freqs > 0) & (doc_freqs <= max_postings) & (idf >= min_idf)
+    LOGGER.info(f'using posting lists of {is_usable.sum()} out of {len(doc_freqs)} tokens')
+
+    trg_mat = trg_mat.tocsr()
+    is_src_token = np.zeros(src_mat.shape[1], dtype=bool)
+    for i in range(src_mat.shape[0]):
+        tokens = src_mat.indices[src_mat.indptr[i]: src_mat.indptr[i + 1]]
+        usable_tokens = tokens[is_usable[tokens]]
+        if len(usable_tokens) == 0:
+            yield i, np.array([], dtype=int), np.array([])
+            continue
+        candidates = np.unique(np.concatenate(
+            [postings.indices[postings.indptr[j]: postings.indptr[j + 1]] for j in usable_tokens]))
+        columns, scores = score_candidates(tokens, candidates, trg_mat, k, is_src_token)
+        yield i, columns, scores
+
+
+def score_candidates(tokens, candidates, trg_mat, k, is_src_token):
+    """
+    exact overlap ratio of tokens with the candidate rows of trg_mat. returns the top k candidates and their scores.
+    is_src_token is a zero-filled buffer of the vocabulary size
+    """
+
+    rows = trg_mat[candidates]
+    is_src_token[tokens] = True
+    overlap = np.bincount(np.repeat(np.arange(len(candidates)), np.diff(rows.indptr)),
+                          weights=is_src_token[rows.indices], minlength=len(candidates))
+    is_src_token[tokens] = False
+
+    scores = overlap / len(tokens)
+    columns = top_k(scores, k)
+    return candidates[columns], scores[columns]
+
+
+HASH_PRIME = (1 << 31) - 1
+
+
+def minhash_signatures(mat, num_perm=128, seed=0, chunk_size=1000):
+    """
+    MinHash signature of the token set of each row. rows without tokens keep HASH_PRIME in every slot
+    """
+
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, HASH_PRIME, size=(num_perm, 1)).astype(np.int64)
+    b = rng.randint(0, HASH_PRIME, size=(num_perm, 1)).astype(np.int64)
+    # hash random values of tokens instead of token ids, since linear hash of consecutive ids is biased
+    token_values = rng.randint(0, HASH_PRIME, size=mat.shape[1]).astype(np.int64)
+
+    mat = mat.tocsr()
+    signatures = np.full((mat.shape[0], num_perm), HASH_PRIME, dtype=np.int64)
+    for start in range(0, mat.shape[0], chunk_size):
+        end = min(start + chunk_size, mat.shape[0])
+        indptr = mat.indptr[start: end + 1]
+        non_empty = np.flatnonzero(np.diff(indptr))
+        if len(non_empty) == 0:
+            continue
+        indices = token_values[mat.indices[indptr[0]: indptr[-1]]]
+        hashes = (a * indices + b) % HASH_PRIME  # num_perm x number of tokens in the chunk
+        signatures[start + non_empty] = np.minimum.reduceat(hashes, indptr[non_empty] - indptr[0], axis=1).T
+    return signatures
+
+
+def to_band_keys(signatures, bands, seed=0):
+    """
+    hash of each band of the signatures. shape is (number of rows, bands)
+    """
+
+    band_rows = signatures.shape[1] // bands
+    multipliers = np.random.RandomState(seed).randint(1, 1 << 62, size=band_rows).astype(np.uint64) | np.uint64(1)
+    keys = signatures[:, :bands * band_rows].astype(np.uint64).reshape(len(signatures), bands, band_rows)
+    with np.errstate(over='ignore'):  # wrap around on purpose
+        return (keys * multipliers).sum(axis=2)
+
+
+def iter_lsh_top_k(src_mat, trg_mat, src_signatures, trg_signatures, k=5, bands=32, max_bucket=1000):
+    """
+    same as iter_overlap_top_k, but only rows of trg_mat sharing a band of MinHash signature with the source are
+    scored. buckets with more than max_bucket rows are ignored
+    """
+
+    is_indexed = trg_signatures[:, 0] != HASH_PRIME  # rows without tokens would all share the same bucket
+    trg_keys = to_band_keys(trg_signatures, bands)
+    src_keys = to_band_keys(src_signatures, bands)
+    tables = []
+    for band in range(bands):
+        rows = np.flatnonzero(is_indexed)
+        order = rows[np.argsort(trg_keys[rows, band], kind='stable')]
+        tables.append((order, trg_keys[order, band]))
+
+    trg_mat = trg_mat.tocsr()
+    is_src_token = np.zeros(src_mat.shape[1], dtype=bool)
+    for i in range(src_mat.shape[0]):
+        tokens = src_mat.indices[src_mat.indptr[i]: src_mat.indptr[i + 1]]
+        buckets = []
+        for band, (order, keys) in enumerate(tables):
+            lo = np.searchsorted(keys, src_keys[i, band], side='left')
+            hi = np.searchsorted(keys, src_keys[i, band], side='right')
+            if 0 < hi - lo <= max_bucket:
+                buckets.append(order[lo:hi])
+        if len(tokens) == 0 or not buckets:
+            yield i, np.array([], dtype=int), np.array([])
+            continue
+        columns, scores = score_candidates(tokens, np.unique(np.concatenate(buckets)), trg_mat, k, is_src_token)
+        yield i, columns, scores
+
+
+def evaluate_recall(approx_map, src_mat, trg_mat, k=5, sample_size=200, seed=0):
+    """
+    compare results of an approximate method with exact top k on sampled rows of src_mat.
+    approx_map: key: row of src_mat, val: (columns, scores).
+    recall is the fraction of exact top k (with positive score) found by the approximate method,
+    score_recall is the sum of approximate scores divided by the sum of exact scores, which ignores ties
+    """
+
+    rng = np.random.RandomState(seed)
+    rows = np.sort(rng.choice(src_mat.shape[0], size=min(sample_size, src_mat.shape[0]), replace=False))
+    hit_count = exact_count = 0
+    approx_score = exact_score = 0.0
+    for j, columns, scores in iter_overlap_top_k(src_mat[rows], trg_mat, k=k):
+        approx_columns, approx_scores = approx_map[rows[j]]
+        exact_columns = set(columns[scores > 0])
+        hit_count += len(exact_columns & set(approx_columns))
+        exact_count += len(exact_columns)
+        approx_score += np.sum(approx_scores)
+        exact_score += np.sum(scores)
+    return {
+        'sample_size': len(rows),
+        'recall': hit_count / exact_count if exact_count else 1.0,
+        'score_recall': approx_score / exact_score if exact_score else 1.0
+    }
@@ -0,0 +1,171 @@
+import os
+from logging import getLogger
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+LOGGER = getLogger(__name__)
+
+FORMAT_ENV = 'TABLE_FORMAT'  # csv (default) or parquet
+ID_LIST = 'id_list'  # list of ints. ';'-joined in CSV
+SCORE_LIST = 'score_list'  # list of floats. ';'-joined with 2 decimals in CSV
+
+SCHEMAS = {  # key: table name, val: dtype of each column
+    'clip': {'clip_id': 'int64', 'name': 'category', 'session': 'int64', 'house': 'category',
+             'meeting': 'category', 'issue': 'int64'},
+    'minutes': {'session': 'int64', 'house': 'category', 'meeting': 'category', 'issue': 'int64'},
+    'member': {'member_id': 'int64', 'group': 'category', 'block': 'category'},
+    'gclip': {'gclip_id': 'int64', 'video_id': 'int64'},
+    'topic': {'topic_id': 'int64', 'category_id': 'int64', 'clip_count': 'int64'},
+    'clip_topic': {'clip_id': 'int64', 'topic_id_list': ID_LIST},
+    'clip_topic_speech': {'clip_id': 'int64', 'topic_id': 'int64', 'count': 'int64', 'position_list': ID_LIST},
+    'clip_category': {'clip_id': 'int64', 'category_id': 'int64'},
+    'clip_minutes': {'clip_id': 'int64', 'speech_id': 'Int64', 'score': 'float64'},
+    'clip_minutes_error': {'clip_id': 'int64'},
+    'clip_member': {'clip_id': 'int64', 'member_id': 'int64'},
+    'clip_gclip': {'clip_id': 'int64', 'gclip_id': 'int64', 'start_msec': 'int64'},
+    'clip_gclip_error': {'clip_id': 'int64'},
+    'clip_clip': {'clip_id': 'int64', 'clip_id_list': ID_LIST, 'score_list': SCORE_LIST},
+    'member_topic': {'member_id': 'int64', 'topic_id_list': ID_LIST, 'clip_count_list': ID_LIST},
+    'member_member': {'member_id': 'int64', 'member_id_list': ID_LIST, 'score_list': SCORE_LIST},
+    'topic_topic': {'topic_id': 'int64', 'topic_id_list': ID_LIST, 'score_list': SCORE_LIST},
+}
+
+_memory = None  # key: normalized path, val: DataFrame. None unless in-memory mode is enabled
+_materialize = True
+
+
+def enable_memory(materialize=False):
+    """
+    keep tables written by write_table in memory so that read_table in the same process skips CSV parsing.
+    CSV files are still written if materialize is True
+    """
+
+    global _memory, _materialize
+    _memory = dict()
+    _materialize = materialize
+
+
+def disable_memory():
+    global _memory, _materialize
+    _memory = None
+    _materialize = True
+
+
+def get_format():
+    return os.environ.get(FORMAT_ENV, 'csv')
+
+
+def table_path(fp):
+    """
+    path where the table declared as fp is stored in the current format
+    """
+
+    if get_format() == 'parquet':
+        return str(Path(fp).with_suffix('.parquet'))
+    return fp
+
+
+def read_table(fp, dtype=None):
+    key = os.path.normpath(fp)
+    schema = SCHEMAS.get(Path(fp).stem, {})
+    if _memory is not None and key in _memory:
+        df = as_csv_dtypes(_memory[key])
+        LOGGER.debug(f'loaded {fp} from memory')
+    elif get_format() == 'parquet':
+        df = read_parquet(table_path(fp))
+    else:
+        df = pd.read_csv(fp, dtype={column: str for column, dtype in schema.items() if dtype in (ID_LIST, SCORE_LIST)})
+
+    df = apply_schema(df, schema)
+    if dtype:
+        df = df.astype(dtype)
+    return df
+
+
+def write_table(df, fp, index_label=None):
+    if index_label:
+        df = df.rename_axis(index_label).reset_index()
+    if _memory is not None:
+        _memory[os.path.normpath(fp)] = df.reset_index(drop=True).copy()
+    if _memory is not None and not _materialize:
+        return
+
+    schema = SCHEMAS.get(Path(fp).stem, {})
+    if get_format() == 'parquet':
+        write_parquet(apply_schema(df, schema), table_path(fp))
+    else:
+        join_list_columns(df, schema).to_csv(fp, index=False)
+
+
+def read_parquet(fp):
+    try:
+        df = pd.read_parquet(fp)
+    except ImportError as e:
+        raise ImportError(f'{FORMAT_ENV}=parquet requires pyarrow (pip install pyarrow)') from e
+    for column in df.columns:  # pyarrow returns list columns as numpy arrays
+        if df[column].dtype == object:
+            df[column] = df[column].map(lambda x: x.tolist() if isinstance(x, np.ndarray) else x)
+    return df
+
+
+def write_parquet(df, fp):
+    try:
+        df.to_parquet(fp, index=False)
+    except ImportError as e:
+        raise ImportError(f'{FORMAT_ENV}=parquet requires pyarrow (pip install pyarrow)') from e
+
+
+def apply_schema(df, schema):
+    df = df.copy()
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype == ID_LIST:
+            df[column] = df[column].map(lambda x: split_list(x, int))
+        elif dtype == SCORE_LIST:
+            df[column] = df[column].map(lambda x: split_list(x, float))
+        elif df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def split_list(value, type_):
+    """
+    empty lists are written as empty cells, which are read as NaN
+    """
+
+    if isinstance(value, str):
+        return [type_(x) for x in value.split(';')]
+    if isinstance(value, list):
+        return [type_(x) for x in value]
+    return []
+
+
+def join_list_columns(df, schema):
+    df = df.copy()
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype == ID_LIST:
+            df[column] = df[column].map(lambda x: ';'.join(map(str, x)) if isinstance(x, list) else x)
+        elif dtype == SCORE_LIST:
+            df[column] = df[column].map(
+                lambda x: ';'.join(map(lambda y: '{:.2f}'.format(y), x)) if isinstance(x, list) else x)
+    return df
+
+
+def as_csv_dtypes(df):
+    """
+    copy of df with the dtypes that pd.read_csv would infer after a CSV round trip
+    """
+
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_extension_array_dtype(series.dtype) and pd.api.types.is_integer_dtype(series.dtype):
+            df[column] = series.astype('float64' if series.isnull().any() else 'int64')
+        elif series.dtype == object:
+            df[column] = series.map(lambda x: np.nan if isinstance(x, str) and x == '' else x)
+    return df
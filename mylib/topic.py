@@ -1,9 +1,11 @@
-from collections import Counter
+from collections import Counter, defaultdict
 from dataclasses import dataclass
 
-import spacy
+import ahocorasick
+import numpy as np
+from scipy.sparse import csr_matrix
 
-nlp = spacy.load('ja_ginza')
+from mylib.nlp import parse
 
 
 @dataclass
@@ -31,6 +33,75 @@ def is_match(query, text):
     return False
 
 
+def parse_query(query):
+    """
+    in: "foo bar;baz"
+    out: [{'foo', 'bar'}, {'baz'}]
+    """
+
+    return [set(item.split()) for item in query.split(';') if item.strip()]
+
+
+class TopicMatcher:
+    """
+    match texts against all topic queries at once.
+    phrases of every query are found by a single automaton, then AND/OR clauses are evaluated from the found phrases
+    """
+
+    def __init__(self, topics):
+        """
+        topics: iterable of (topic_id, query)
+        """
+
+        self.topic_ids = []
+        self.clause_topics = []  # key: clause index, val: topic index
+        self.clause_sizes = []  # key: clause index, val: number of phrases
+        self.phrase_clauses = defaultdict(list)  # key: phrase, val: list of clause index
+        self.topic_phrases = dict()  # key: topic_id, val: set of phrases in the query
+        for topic_index, (topic_id, query) in enumerate(topics):
+            self.topic_ids.append(topic_id)
+            self.topic_phrases[topic_id] = set()
+            for phrases in parse_query(query):
+                self.topic_phrases[topic_id].update(phrases)
+                for phrase in phrases:
+                    self.phrase_clauses[phrase].append(len(self.clause_topics))
+                self.clause_topics.append(topic_index)
+                self.clause_sizes.append(len(phrases))
+
+        self.automaton = ahocorasick.Automaton()
+        for phrase in self.phrase_clauses:
+            self.automaton.add_word(phrase, phrase)
+        self.automaton.make_automaton()
+
+    def find_phrases(self, text):
+        return {phrase for _, _, phrase in self.iter_phrases(text)}
+
+    def iter_phrases(self, text):
+        """
+        yield (start, end, phrase) of every occurrence of query phrases in text
+        """
+
+        if not self.phrase_clauses:
+            return
+        for last, phrase in self.automaton.iter(text):
+            yield last + 1 - len(phrase), last + 1, phrase
+
+    def match_phrases(self, phrases):
+        """
+        list of topic_id whose query is satisfied by the phrases, in the order of the topics given to the constructor
+        """
+
+        hit_counts = Counter()
+        for phrase in phrases:
+            hit_counts.update(self.phrase_clauses.get(phrase, []))
+        topic_indices = {self.clause_topics[clause] for clause, count in hit_counts.items()
+                         if count == self.clause_sizes[clause]}
+        return [self.topic_ids[i] for i in sorted(topic_indices)]
+
+    def match(self, text):
+        return self.match_phrases(self.find_phrases(text))
+
+
 @dataclass
 class Clip:
     clip_id: int
@@ -49,8 +120,7 @@ class Clip:
 
 
 def extract_phrase_list(text):
-    with nlp.select_pipes(enable=['parser']):
-        doc = nlp(text)
+    doc = parse(text)
 
     phrase_list = []
     buffer = ''
@@ -69,13 +139,38 @@ def extract_phrase_list(text):
 
 class TopicGenerator:
     """
-    Helper class to define topics manually
+    Helper class to define topics manually.
+    clips of each topic are computed with bitwise operations over cached phrase bitsets, and phrase counts for
+    suggest are maintained incrementally as topics are added, edited or removed
     """
 
     def __init__(self, clip_list):
         self.clip_map = dict()
         for clip in clip_list:
             self.clip_map[clip.clip_id] = clip
+        self.clip_ids = list(self.clip_map)
+        self.titles = [clip.title for clip in self.clip_map.values()]
+        self.phrase_bits = dict()  # key: query phrase, val: bool array of clips whose title contains the phrase
+
+        # noun phrases of clips used by suggest
+        phrase_index = dict()
+        rows, columns = [], []
+        for i, clip in enumerate(self.clip_map.values()):
+            for phrase in clip.phrase_list:
+                columns.append(phrase_index.setdefault(phrase, len(phrase_index)))
+                rows.append(i)
+        self.phrases = list(phrase_index)
+        self.phrase_lens = np.array([len(phrase) for phrase in self.phrases], dtype=int)
+        self.phrase_mat = csr_matrix((np.ones(len(rows), dtype=int), (rows, columns)),
+                                     shape=(len(self.clip_ids), len(self.phrases)))  # clip x phrase counts
+        self.all_counts = np.asarray(self.phrase_mat.sum(axis=0)).ravel()
+        self.default_counts = self.all_counts.copy()  # phrase counts of clips without topic
+        self.topic_counts = dict()  # key: topic_id, val: phrase counts of clips of the topic
+
+        self.membership = np.zeros((len(self.clip_ids), 0), dtype=bool)  # clip x topic
+        self.topic_columns = dict()  # key: topic_id, val: column of membership
+        self.free_columns = []
+        self.clip_topic_counts = np.zeros(len(self.clip_ids), dtype=int)
 
         self.query_set = set()
         self.topic_map = dict()
@@ -93,38 +188,99 @@ class TopicGenerator:
             self.set(topic)
 
     def set(self, topic):
+        if topic.topic_id in self.topic_map:
+            self.remove(topic.topic_id)
+        self.query_set.update((topic.query,))
         self.topic_map[topic.topic_id] = topic
         self._index(topic.topic_id)
 
     def get(self, topic_id):
         return self.topic_map[topic_id]
 
+    def edit(self, topic_id, query):
+        topic = Topic(topic_id=topic_id, query=query, clip_id_list=list())
+        self.set(topic)
+        return topic
+
+    def remove(self, topic_id):
+        self._unindex(topic_id)
+        topic = self.topic_map.pop(topic_id)
+        self.query_set.discard(topic.query)
+        return topic
+
     def suggest(self, topic_id='default', len_thresh=4):
         """
         suggest candidate topics
         """
 
-        clip_id_list = []
         if topic_id == 'default':  # use clips without topic
-            for clip_id, clip in self.clip_map.items():
-                if not clip.topic_id_list:
-                    clip_id_list.append(clip_id)
+            counts = self.default_counts
         elif topic_id == 'all':  # use all clips
-            clip_id_list = self.clip_map.keys()
+            counts = self.all_counts
         else:  # use clips belong to the specified topic_id
-            clip_id_list = self.topic_map[int(topic_id)].clip_id_list
+            counts = self.topic_counts[int(topic_id)]
 
         counter = Counter()
-        for clip_id in clip_id_list:
-            clip = self.clip_map[clip_id]
-            for phrase in clip.phrase_list:
-                if len(phrase) >= len_thresh:
-                    counter[phrase] += 1
+        for i in np.flatnonzero((counts > 0) & (self.phrase_lens >= len_thresh)):
+            counter[self.phrases[i]] = int(counts[i])
         return counter
 
+    def get_phrase_bits(self, phrase):
+        if phrase not in self.phrase_bits:
+            self.phrase_bits[phrase] = np.fromiter((phrase in title for title in self.titles), dtype=bool,
+                                                   count=len(self.titles))
+        return self.phrase_bits[phrase]
+
+    def get_query_bits(self, query):
+        bits = np.zeros(len(self.clip_ids), dtype=bool)
+        for phrases in parse_query(query):
+            clause_bits = np.ones(len(self.clip_ids), dtype=bool)
+            for phrase in phrases:
+                clause_bits &= self.get_phrase_bits(phrase)
+            bits |= clause_bits
+        return bits
+
+    def _allocate_column(self, topic_id):
+        if self.free_columns:
+            column = self.free_columns.pop()
+        else:
+            column = len(self.topic_columns)
+            if column == self.membership.shape[1]:  # double the capacity
+                extra = np.zeros((len(self.clip_ids), max(column, 16)), dtype=bool)
+                self.membership = np.hstack([self.membership, extra])
+        self.topic_columns[topic_id] = column
+        return column
+
+    def _update_default_counts(self, bits, delta):
+        had_topic = self.clip_topic_counts > 0
+        self.clip_topic_counts[bits] += delta
+        has_topic = self.clip_topic_counts > 0
+        for rows, sign in [(np.flatnonzero(~had_topic & has_topic), -1), (np.flatnonzero(had_topic & ~has_topic), 1)]:
+            if len(rows):
+                self.default_counts += sign * np.asarray(self.phrase_mat[rows].sum(axis=0)).ravel()
+
     def _index(self, topic_id):
         topic = self.topic_map[topic_id]
-        for clip in self.clip_map.values():
-            if topic.matches(clip.title):
-                clip.topic_id_list.append(topic.topic_id)
-                topic.clip_id_list.append(clip.clip_id)
+        bits = self.get_query_bits(topic.query)
+        column = self._allocate_column(topic_id)
+        self.membership[:, column] = bits
+        self._update_default_counts(bits, 1)
+        self.topic_counts[topic_id] = self.phrase_mat.T @ bits.astype(int)
+
+        for i in np.flatnonzero(bits):
+            clip = self.clip_map[self.clip_ids[i]]
+            clip.topic_id_list.append(topic.topic_id)
+            topic.clip_id_list.append(clip.clip_id)
+
+    def _unindex(self, topic_id):
+        topic = self.topic_map[topic_id]
+        column = self.topic_columns.pop(topic_id)
+        bits = self.membership[:, column].copy()
+        self.membership[:, column] = False
+        self.free_columns.append(column)
+        self._update_default_counts(bits, -1)
+        del self.topic_counts[topic_id]
+
+        for i in np.flatnonzero(bits):
+            self.clip_map[self.clip_ids[i]].topic_id_list.remove(topic_id)
+        topic.clip_id_list.clear()
@@ -0,0 +1,104 @@
+from logging import getLogger
+from pathlib import Path
+
+import numpy as np
+
+LOGGER = getLogger(__name__)
+
+TRANSCRIPT_DIREC = './out/transcript'
+SPAN_DTYPE = np.dtype([('start_msec', 'i8'), ('end_msec', 'i8'), ('start', 'i8'), ('end', 'i8')])
+
+
+class Transcript:
+    """
+    speeches of a gclip video as arrays sorted by start_msec.
+    text of all speeches is kept in one string and each speech is sliced by its character offsets
+    """
+
+    def __init__(self, gclip_id, spans, text):
+        self.gclip_id = gclip_id
+        self.spans = spans
+        self.text = text
+        self.start_msec = spans['start_msec']
+        self.end_msec = np.maximum.accumulate(spans['end_msec']) if len(spans) else spans['end_msec']
+
+    @classmethod
+    def from_record(cls, gclip_id, gclip_record):
+        speech_list = sorted(gclip_record['speech_list'], key=lambda x: x['start_msec'])
+        spans = np.zeros(len(speech_list), dtype=SPAN_DTYPE)
+        offset = 0
+        for i, speech in enumerate(speech_list):
+            spans[i] = (speech['start_msec'], speech['end_msec'], offset, offset + len(speech['speech']))
+            offset += len(speech['speech'])
+        return cls(gclip_id, spans, ''.join(speech['speech'] for speech in speech_list))
+
+    @classmethod
+    def load(cls, gclip_id, direc=TRANSCRIPT_DIREC):
+        spans = np.load(Path(direc) / f'{gclip_id}.npy')
+        with open(Path(direc) / f'{gclip_id}.txt', 'r') as f:
+            text = f.read()
+        return cls(gclip_id, spans, text)
+
+    def save(self, direc=TRANSCRIPT_DIREC):
+        np.save(Path(direc) / f'{self.gclip_id}.npy', self.spans)
+        with open(Path(direc) / f'{self.gclip_id}.txt', 'w') as f:
+            f.write(self.text)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def get_text(self, i):
+        return self.text[self.spans['start'][i]: self.spans['end'][i]]
+
+    def texts(self):
+        return [self.get_text(i) for i in range(len(self))]
+
+    def ngram_index(self, n):
+        """
+        key: character n-gram, val: sorted list of indices of the speeches containing it.
+        the index is much larger than the text, so it is not kept with the transcript (which is shared by
+        record_cache) and callers should drop it once done
+        """
+
+        index = dict()
+        for i in range(len(self)):
+            text = self.get_text(i)
+            for start in range(len(text) - n + 1):
+                postings = index.setdefault(text[start: start + n], [])
+                if not postings or postings[-1] != i:
+                    postings.append(i)
+        return index
+
+    def find(self, start_msec):
+        """
+        index of the speech starting exactly at start_msec, or None
+        """
+
+        i = np.searchsorted(self.start_msec, start_msec)
+        if i < len(self) and self.start_msec[i] == start_msec:
+            return int(i)
+        return None
+
+    def find_nearest(self, msec):
+        """
+        index of the speech whose start_msec is closest to msec, or None if the transcript is empty
+        """
+
+        if not len(self):
+            return None
+        i = np.searchsorted(self.start_msec, msec)
+        if i == len(self) or (i > 0 and msec - self.start_msec[i - 1] <= self.start_msec[i] - msec):
+            i -= 1
+        return int(i)
+
+    def find_range(self, start_msec, end_msec):
+        """
+        indices of speeches overlapping with [start_msec, end_msec)
+        """
+
+        # end_msec is the running maximum, so speeches from lo may still be nested in an earlier longer speech
+        lo = np.searchsorted(self.end_msec, start_msec, side='right')
+        hi = max(lo, np.searchsorted(self.start_msec, end_msec, side='left'))
+        is_overlapped = self.spans['end_msec'][lo:hi] > start_msec
+        return (lo + np.flatnonzero(is_overlapped)).tolist()
+
@@ -1,20 +1,96 @@
 import json
-from collections import defaultdict
+import os
+from collections import defaultdict, OrderedDict
+from logging import getLogger
 
 import ahocorasick
-import pandas as pd
 
 from mylib.artifact import Topic
+from mylib.canonicalize import normalize_text
+from mylib.corpus import open_corpus
+from mylib.table import read_table
+from mylib.transcript import Transcript
+
+LOGGER = getLogger(__name__)
+
+
+class RecordCache:
+    """
+    LRU cache of parsed JSON records bounded by the number of entries and the total file size.
+    records are shared between callers and must not be modified
+    """
+
+    def __init__(self, max_entries=128, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.records = OrderedDict()  # key: (path, mtime), val: (record, file size)
+        self.bytes = 0
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def load(self, fp, loader=None):
+        stat = os.stat(fp)
+        key = (fp, stat.st_mtime_ns)
+        if key in self.records:
+            self.hit_count += 1
+            self.records.move_to_end(key)
+            return self.records[key][0]
+
+        self.miss_count += 1
+        record = loader(fp) if loader else load_json(fp)
+        self.records[key] = (record, stat.st_size)
+        self.bytes += stat.st_size
+        while len(self.records) > 1 and (len(self.records) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, size) = self.records.popitem(last=False)
+            self.bytes -= size
+        return record
+
+    def configure(self, max_entries=None, max_bytes=None):
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+
+    def clear(self):
+        self.records.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {'hits': self.hit_count, 'misses': self.miss_count, 'entries': len(self.records), 'bytes': self.bytes}
+
+
+record_cache = RecordCache()
 
 
 def load_minutes_record(minutes_id):
     minutes_fp = f'./out/minutes/{minutes_id}.json'
-    return load_json(minutes_fp)
+    return record_cache.load(minutes_fp)
+
+
+def get_speech_fp(minutes_id):
+    return f'./out/speech/{minutes_id}.json'
+
+
+def load_speech_record(minutes_id):
+    """
+    normalized speeches of the minutes built by speech.py
+    """
+
+    return record_cache.load(get_speech_fp(minutes_id))
 
 
 def load_gclip_record(gclip_id):
     gclip_fp = f'./out/gclip/{gclip_id}.json'
-    return load_json(gclip_fp)
+    return record_cache.load(gclip_fp)
+
+
+def load_transcript(gclip_id):
+    """
+    Transcript of the gclip built by gclip.py
+    """
+
+    transcript_fp = f'./out/transcript/{gclip_id}.txt'
+    return record_cache.load(transcript_fp, loader=lambda _: Transcript.load(gclip_id))
 
 
 def load_json(fp):
@@ -24,15 +100,33 @@ def load_json(fp):
 
 
 def load_minutes_text(minutes_id, speech_id):
-    minutes_record = load_minutes_record(minutes_id)
-    return minutes_record['speechRecord'][speech_id]['speech']
+    """
+    raw speech sliced out of the packed corpus built by minutes_corpus.py
+    """
+
+    return open_corpus().get_text(minutes_id, speech_id)
+
+
+def load_speech_text(minutes_id, speech_id, speech_count=1, speech_thresh=None):
+    """
+    normalized text of speech_count speeches starting from speech_id, without speaker names.
+    speeches longer than speech_thresh are cut as in build_artifact_clip.format_speech_text before normalization
+    """
+
+    texts = []
+    for speech in load_speech_record(minutes_id)['speeches'][speech_id: speech_id + speech_count]:
+        if speech_thresh is not None and len(speech['text']) > speech_thresh:
+            texts.append(normalize_text(speech['text'][:speech_thresh] + '...'))
+        else:
+            texts.append(speech['normalized_text'])
+    return ''.join(texts)
 
 
 def load_gclip_text(gclip_id, start_msec):
-    gclip_record = load_gclip_record(gclip_id)
-    for speech in gclip_record['speech_list']:
-        if speech['start_msec'] == start_msec:
-            return speech['speech']
+    transcript = load_transcript(gclip_id)
+    i = transcript.find(start_msec)
+    if i is not None:
+        return transcript.get_text(i)
 
 
 def to_time_str(msec):
@@ -96,14 +190,14 @@ def to_token_set(doc):
 
 
 def flatten_id_list(df, list_column, flat_column):
-    df[list_column] = df[list_column].apply(lambda x: x.split(';'))
-    df = df.explode(list_column).rename(columns={list_column: flat_column})
+    df = df.explode(list_column).dropna(subset=[list_column])  # empty lists are exploded to NaN
+    df = df.rename(columns={list_column: flat_column})
     df[flat_column] = df[flat_column].astype(int)
     return df
 
 
 def load_topic_map(topic_fp):
-    topic_df = pd.read_csv(topic_fp)
+    topic_df = read_table(topic_fp)
     topic_map = dict()
     for _, row in topic_df.iterrows():
         topic_id = row['topic_id']
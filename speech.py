@@ -0,0 +1,48 @@
+import json
+import logging
+from pathlib import Path
+
+from mylib.canonicalize import canonicalize_speech
+from mylib.corpus import MinutesCorpus
+
+LOGGER = logging.getLogger(__name__)
+
+
+def main(corpus_direc, speech_direc):
+    Path(speech_direc).mkdir(parents=True, exist_ok=True)
+    corpus = MinutesCorpus(corpus_direc)
+
+    update_ids = []
+    for minutes_id in corpus.minutes_ids():
+        speech_fp = Path(speech_direc) / f'{minutes_id}.json'
+        if speech_fp.exists():
+            with open(speech_fp, 'r') as f:
+                if json.load(f)['source_hash'] == corpus.source_hash(minutes_id):
+                    continue
+        update_ids.append(minutes_id)
+
+    for minutes_id in update_ids:
+        speech_record = {
+            'minutes_id': minutes_id,
+            'source_hash': corpus.source_hash(minutes_id),
+            'speeches': [canonicalize_speech(record) for _, _, record in corpus.iter_speeches([minutes_id])]
+        }
+        speech_fp = Path(speech_direc) / f'{minutes_id}.json'
+        with open(speech_fp, 'w') as f:
+            json.dump(speech_record, f, ensure_ascii=False)
+        LOGGER.debug(f'saved {speech_fp}')
+    corpus.close()
+
+    for speech_fp in Path(speech_direc).glob('*.json'):
+        if speech_fp.stem not in corpus:
+            speech_fp.unlink()
+            LOGGER.info(f'removed {speech_fp}')
+    LOGGER.info(f'updated {len(update_ids)} of {len(corpus.minutes_ids())} records in {speech_direc}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(
+        corpus_direc='./out/corpus',
+        speech_direc='./out/speech',
+    )
@@ -1,47 +1,69 @@
 import logging
-from collections import defaultdict
 
 import numpy as np
 import pandas as pd
-from sklearn.metrics import pairwise_distances
+from scipy.sparse import csr_matrix, hstack
 
+from mylib.similarity import iter_cosine_top_k, normalize_rows
+from mylib.table import read_table, write_table
 from mylib.utils import flatten_id_list
 
 LOGGER = logging.getLogger(__name__)
 
+TOP_K = 5
 
-def main(clip_fp, topic_fp, clip_topic_fp, topic_topic_fp):
-    clip_df = pd.read_csv(clip_fp)
-    topic_df = pd.read_csv(topic_fp)
-    clip_topic_df = pd.read_csv(clip_topic_fp)
+
+def to_indicator(rows, columns, shape):
+    """
+    sparse matrix counting each (row, column) pair. pairs with a negative index are ignored
+    """
+
+    rows, columns = np.asarray(rows), np.asarray(columns)
+    is_valid = (rows >= 0) & (columns >= 0)
+    data = np.ones(is_valid.sum(), dtype=np.float64)
+    return csr_matrix((data, (rows[is_valid], columns[is_valid])), shape=shape)
+
+
+def main(clip_fp, topic_fp, clip_topic_fp, topic_topic_fp, clip_weight=0.0):
+    """
+    topics are similar if their clips are distributed over the same meetings (cosine similarity of topic x meeting
+    counts), or if they share clips (cosine similarity of topic x clip), blended by clip_weight
+    """
+
+    clip_df = read_table(clip_fp)
+    topic_df = read_table(topic_fp)
+    clip_topic_df = read_table(clip_topic_fp)
     clip_topic_df = flatten_id_list(clip_topic_df, 'topic_id_list', 'topic_id')
-    clip_topic_df = pd.merge(clip_topic_df, clip_df[['clip_id', 'meeting']])
 
-    # 所属委員会の分布のコサイン類似度からトピック間の距離を算出する
     topic_id_list = list(topic_df['topic_id'])
-    meeting_list = list(set(clip_df['meeting']))
-    feature_mat = np.zeros((len(topic_id_list), len(meeting_list)))
-    for i, topic_id in enumerate(topic_id_list):
-        df = clip_topic_df[clip_topic_df['topic_id'] == topic_id]
-        value_count_map = defaultdict(int)
-        value_count_map.update(df['meeting'].value_counts().to_dict())
-        for j, meeting in enumerate(meeting_list):
-            feature_mat[i][j] = value_count_map[meeting]
-    dist_mat = 1 - pairwise_distances(feature_mat, metric='cosine')
+    clip_index = pd.Index(clip_df['clip_id'])
+    meeting_codes, meetings = pd.factorize(clip_df['meeting'])
+    topic_clip_mat = to_indicator(pd.Index(topic_id_list).get_indexer(clip_topic_df['topic_id']),
+                                  clip_index.get_indexer(clip_topic_df['clip_id']),
+                                  shape=(len(topic_id_list), len(clip_index)))
+    clip_meeting_mat = to_indicator(np.arange(len(clip_index)), meeting_codes, shape=(len(clip_index), len(meetings)))
+    topic_meeting_mat = topic_clip_mat @ clip_meeting_mat
+    LOGGER.info(f'built features of {len(topic_id_list)} topics '
+                f'over {len(meetings)} meetings and {len(clip_index)} clips')
+
+    # dot products of the stacked rows are the blend of both cosine similarities
+    blocks = []
+    if clip_weight < 1:
+        blocks.append(normalize_rows(topic_meeting_mat) * np.sqrt(1 - clip_weight))
+    if clip_weight > 0:
+        blocks.append(normalize_rows(topic_clip_mat) * np.sqrt(clip_weight))
+    feature_mat = hstack(blocks).tocsr()
 
     records = []
-    for i, topic_id in enumerate(topic_id_list):
-        j_list = np.argsort(dist_mat[i])[-5:][::-1]
-        sim_id_list = [topic_id_list[j] for j in j_list]
-        score_list = map(lambda j: dist_mat[i][j], j_list)
+    for i, columns, scores in iter_cosine_top_k(feature_mat, k=TOP_K, normalize=False):
         records.append({
-            'topic_id': topic_id,
-            'topic_id_list': ';'.join(map(str, sim_id_list)),
-            'score_list': ';'.join(map(lambda x: '{:.2f}'.format(x), score_list))
+            'topic_id': topic_id_list[i],
+            'topic_id_list': [topic_id_list[j] for j in columns],
+            'score_list': scores.tolist()
         })
 
     out_df = pd.DataFrame(records)
-    out_df.to_csv(topic_topic_fp, index=False)
+    write_table(out_df, topic_topic_fp)
     LOGGER.info(f'saved {len(out_df)} records to {topic_topic_fp}')
 
 